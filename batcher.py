@@ -1,5 +1,6 @@
+import re
 from dataclasses import dataclass, field
-from typing import List, Dict, Set, Optional, Literal, Tuple
+from typing import Any, Callable, List, Dict, Set, Optional, Literal, Tuple
 from collections import defaultdict
 
 # =========================
@@ -16,16 +17,21 @@ class Issue:
     output_path: str
     expected_count: Optional[int]
     observed_count: Optional[int]
+    # Set when the issue stands for many positional diffs (diff_cluster)
+    occurrences: int = 1
+    sample_positions: Tuple[str, ...] = ()
 
 
 @dataclass
 class XSLTTemplate:
-    """Found via static analysis of XSLT (future use)"""
+    """Found via static analysis of XSLT (see xslt_analysis)"""
     match: str
     output_paths: Set[str]
     line_start: int
-    line_end: int
+    line_end: Optional[int]  # None when the source text is unknown
     dependencies: List[str] = field(default_factory=list)
+    kind: str = "template"  # "template" or "for-each"
+    node: Any = field(default=None, repr=False, compare=False)
 
 
 @dataclass
@@ -52,6 +58,101 @@ def parent_xpath(path: str) -> Optional[str]:
     return "/" + "/".join(parts[:-1])
 
 
+_PREDICATE = re.compile(r"\[[^\]]*\]")
+
+
+def normalize_path(path: str) -> str:
+    """'/ns0:A[1]/B[3]' -> '/A/B'"""
+    steps = _PREDICATE.sub("", path).strip("/").split("/")
+    return "/" + "/".join(s.split(":")[-1] for s in steps if s)
+
+
+def common_xpath(paths: List[str]) -> str:
+    """Deepest path shared (segment-wise) by all paths."""
+    split = [[p for p in path.strip("/").split("/") if p] for path in paths]
+    common = []
+    for segs in zip(*split):
+        if any(s != segs[0] for s in segs):
+            break
+        common.append(segs[0])
+    return "/" + "/".join(common)
+
+
+# =========================
+# Token Estimation
+# =========================
+
+Tokenizer = Callable[[str], int]
+SliceLookup = Callable[[Batch], str]
+
+BYTES_PER_TOKEN = 4
+PROMPT_OVERHEAD_TOKENS = 400  # fixed instructions/rules around each call
+# Packed batches must share at least this many root path steps; a
+# shallower common root would put most of the stylesheet in the prompt
+MIN_PACK_ROOT_DEPTH = 2
+
+
+def byte_tokenizer(text: str) -> int:
+    """Fast offline estimate: ~4 UTF-8 bytes per token, rounded up."""
+    return -(-len(text.encode("utf-8")) // BYTES_PER_TOKEN)
+
+
+_tokenizer: Tokenizer = byte_tokenizer
+
+
+def set_tokenizer(tokenizer: Optional[Tokenizer]):
+    """
+    Install a real tokenizer (text -> token count), e.g.
+    lambda t: len(tiktoken.get_encoding("cl100k_base").encode(t)).
+    None restores the byte-based fallback.
+    """
+    global _tokenizer
+    _tokenizer = tokenizer or byte_tokenizer
+
+
+def estimate_tokens(text: str, tokenizer: Optional[Tokenizer] = None) -> int:
+    if not text:
+        return 0
+    return (tokenizer or _tokenizer)(text)
+
+
+def issue_payload(issue: Issue) -> str:
+    """Text an issue contributes to a prompt."""
+    text = (
+        f"{issue.case} {issue.output_path} "
+        f"expected={issue.expected_count} observed={issue.observed_count}"
+    )
+    if issue.occurrences > 1:
+        text += f" occurrences={issue.occurrences}"
+    if issue.sample_positions:
+        text += f" e.g. {', '.join(issue.sample_positions)}"
+    return text
+
+
+def issues_tokens(issues: List[Issue], tokenizer: Optional[Tokenizer] = None) -> int:
+    """Additive per-issue estimate, so chunk and bin totals add up exactly."""
+    return sum(estimate_tokens(issue_payload(i) + "\n", tokenizer) for i in issues)
+
+
+def annotate_tokens(
+    batches: List[Batch],
+    slice_for: Optional[SliceLookup] = None,
+    tokenizer: Optional[Tokenizer] = None,
+) -> List[Batch]:
+    """
+    Fill in estimated_tokens: prompt overhead + issue payload +
+    the responsible XSLT slice (if slice_for can provide it).
+    """
+    for batch in batches:
+        slice_text = slice_for(batch) if slice_for else ""
+        batch.estimated_tokens = (
+            PROMPT_OVERHEAD_TOKENS
+            + issues_tokens(batch.issues, tokenizer)
+            + estimate_tokens(slice_text, tokenizer)
+        )
+    return batches
+
+
 # =========================
 # Batching Functions
 # =========================
@@ -156,19 +257,17 @@ def adaptive_merge(batches: List[Batch], max_batch_size: int = 10) -> List[Batch
             # Combine into one batch
             all_issues = []
             all_history = []
-            all_templates = []
             
             for b in group:
                 all_issues.extend(b.issues)
                 all_history.extend(b.history)
-                all_templates.extend(b.responsible_templates)
             
             merged.append(
                 Batch(
                     case=group[0].case,
                     batch_root=parent,
                     issues=all_issues,
-                    responsible_templates=all_templates,
+                    responsible_templates=shared_templates(group),
                     history=all_history + [f"merged {len(group)} batches"]
                 )
             )
@@ -196,11 +295,266 @@ def split_batch(batch: Batch, max_size: int) -> List[Batch]:
     return chunks
 
 
+def split_to_budget(
+    batch: Batch,
+    token_budget: int,
+    slice_tokens: int,
+    tokenizer: Optional[Tokenizer] = None,
+) -> List[Batch]:
+    """Split a batch into the fewest consecutive chunks that fit the budget."""
+    room = max(token_budget - PROMPT_OVERHEAD_TOKENS - slice_tokens, 1)
+    chunks: List[List[Issue]] = [[]]
+    used = 0
+
+    for issue in batch.issues:
+        cost = issues_tokens([issue], tokenizer)
+        if chunks[-1] and used + cost > room:
+            chunks.append([])
+            used = 0
+        chunks[-1].append(issue)
+        used += cost
+
+    return [
+        Batch(
+            case=batch.case,
+            batch_root=batch.batch_root,
+            issues=chunk,
+            responsible_templates=batch.responsible_templates,
+            estimated_tokens=(
+                PROMPT_OVERHEAD_TOKENS + slice_tokens + issues_tokens(chunk, tokenizer)
+            ),
+            history=batch.history + [f"token split chunk {n}/{len(chunks)}"],
+        )
+        for n, chunk in enumerate(chunks, 1)
+    ]
+
+
+def xpath_depth(path: str) -> int:
+    return len([p for p in path.strip("/").split("/") if p])
+
+
+def pack_batches(
+    batches: List[Batch],
+    token_budget: int,
+    slice_for: Optional[SliceLookup] = None,
+    tokenizer: Optional[Tokenizer] = None,
+    min_root_depth: int = MIN_PACK_ROOT_DEPTH,
+) -> List[Batch]:
+    """
+    Bin-pack batches into as few LLM calls as fit token_budget
+    (first-fit decreasing). Prompt overhead is paid once per call.
+    Batches that alone exceed the budget are split first.
+
+    A packed call's root is the common_xpath of its members, so batches
+    only share a call when that root is at least min_root_depth deep,
+    and the call is costed with the slice at the merged root (from
+    slice_for) rather than the members' own slices.
+    """
+    slice_cache = {}
+
+    def root_slice_tokens(probe: Batch) -> int:
+        if slice_for is None:
+            return 0
+        key = (probe.batch_root, tuple(id(t) for t in probe.responsible_templates))
+        if key not in slice_cache:
+            slice_cache[key] = estimate_tokens(slice_for(probe), tokenizer)
+        return slice_cache[key]
+
+    items = []  # (batch, issue_tokens, slice_tokens)
+    for batch in batches:
+        slice_tokens = root_slice_tokens(batch)
+        parts = [batch]
+        if (PROMPT_OVERHEAD_TOKENS + slice_tokens
+                + issues_tokens(batch.issues, tokenizer) > token_budget
+                and len(batch.issues) > 1):
+            parts = split_to_budget(batch, token_budget, slice_tokens, tokenizer)
+        for part in parts:
+            items.append((part, issues_tokens(part.issues, tokenizer), slice_tokens))
+
+    items.sort(key=lambda it: it[1] + it[2], reverse=True)
+
+    bins = []  # [total_tokens, issue_tokens, [batches], root]
+    for batch, cost, slice_tokens in items:
+        for b in bins:
+            root = common_xpath([b[3], batch.batch_root])
+            if xpath_depth(root) < min_root_depth:
+                continue
+            group = b[2] + [batch]
+            probe = Batch(
+                case=group[0].case,
+                batch_root=root,
+                issues=[i for m in group for i in m.issues],
+                responsible_templates=shared_templates(group),
+            )
+            total = PROMPT_OVERHEAD_TOKENS + b[1] + cost + root_slice_tokens(probe)
+            if total <= token_budget:
+                b[0], b[1], b[3] = total, b[1] + cost, root
+                b[2].append(batch)
+                break
+        else:
+            bins.append(
+                [PROMPT_OVERHEAD_TOKENS + cost + slice_tokens, cost, [batch], batch.batch_root]
+            )
+
+    packed = []
+    for total, _, group, root in bins:
+        if len(group) == 1:
+            group[0].estimated_tokens = total
+            packed.append(group[0])
+            continue
+        packed.append(
+            Batch(
+                case=group[0].case,
+                batch_root=root,
+                issues=[i for b in group for i in b.issues],
+                responsible_templates=shared_templates(group),
+                estimated_tokens=total,
+                history=[h for b in group for h in b.history]
+                + [f"packed {len(group)} batches into {total}/{token_budget} tokens"],
+            )
+        )
+    return packed
+
+
+# =========================
+# Template Attribution
+# =========================
+
+def template_span(t: XSLTTemplate) -> int:
+    """Size of the block: line count, or element count without line ranges."""
+    if t.line_end is None:
+        return sum(1 for _ in t.node.iter()) if t.node is not None else 0
+    return t.line_end - t.line_start
+
+
+def templates_overlap(a: XSLTTemplate, b: XSLTTemplate) -> bool:
+    """Same block, or one nested inside the other."""
+    if a.node is not None and b.node is not None:
+        return (
+            a.node is b.node
+            or any(n is b.node for n in a.node.iterancestors())
+            or any(n is a.node for n in b.node.iterancestors())
+        )
+    if a.line_end is None or b.line_end is None:
+        return True  # unknown extent: assume a conflict
+    return a.line_start <= b.line_end and b.line_start <= a.line_end
+
+
+def responsible_for(path: str, templates: List[XSLTTemplate]) -> Optional[XSLTTemplate]:
+    """
+    Innermost block that emits path; for paths nothing emits (MISSING),
+    the innermost block emitting its nearest emitted ancestor.
+    """
+    path = normalize_path(path)
+    while path and path != "/":
+        owners = [t for t in templates if path in t.output_paths]
+        if owners:
+            return min(owners, key=template_span)
+        path = parent_xpath(path)
+    return None
+
+
+def attach_templates(batches: List[Batch], templates: List[XSLTTemplate]) -> List[Batch]:
+    for batch in batches:
+        found = {}
+        for issue in batch.issues:
+            t = responsible_for(issue.output_path, templates)
+            if t is not None:
+                found[id(t)] = t
+        batch.responsible_templates = list(found.values())
+    return batches
+
+
+def shared_templates(batches: List[Batch]) -> List[XSLTTemplate]:
+    """Responsible templates of all batches, each once, in first-seen order."""
+    found = {}
+    for batch in batches:
+        for t in batch.responsible_templates:
+            found.setdefault(id(t), t)
+    return list(found.values())
+
+
+def template_key(batch: Batch) -> Tuple[Tuple[int, int, int], ...]:
+    return tuple(sorted(
+        (t.line_start, t.line_end or 0, id(t.node)) for t in batch.responsible_templates
+    ))
+
+
+def merge_by_template(batches: List[Batch]) -> List[Batch]:
+    """
+    Merge batches of the same case whose issues map to exactly the same
+    responsible templates: they would edit the same block anyway.
+    Batches without attributed templates are left alone.
+    """
+    groups: Dict[Tuple, List[Batch]] = {}
+    ordered: List[List[Batch]] = []  # groups at their first member's position
+    for batch in batches:
+        key = template_key(batch)
+        if not key:
+            ordered.append([batch])
+            continue
+        if (batch.case, key) not in groups:
+            groups[(batch.case, key)] = []
+            ordered.append(groups[(batch.case, key)])
+        groups[(batch.case, key)].append(batch)
+
+    merged = []
+    for group in ordered:
+        if len(group) == 1:
+            merged.append(group[0])
+            continue
+        merged.append(
+            Batch(
+                case=group[0].case,
+                batch_root=common_xpath([b.batch_root for b in group]),
+                issues=[i for b in group for i in b.issues],
+                responsible_templates=group[0].responsible_templates,
+                history=[h for b in group for h in b.history]
+                + [f"merged {len(group)} batches on shared template"],
+            )
+        )
+    return merged
+
+
+def concurrent_groups(batches: List[Batch]) -> List[List[Batch]]:
+    """
+    Partition batches into waves whose responsible templates are pairwise
+    disjoint, so every batch in a wave can be repaired concurrently.
+    Batches with no attributed template each get a wave of their own.
+    """
+    waves: List[List[Batch]] = []
+    for batch in batches:
+        if not batch.responsible_templates:
+            waves.append([batch])
+            continue
+        for wave in waves:
+            if all(
+                b.responsible_templates and not any(
+                    templates_overlap(x, y)
+                    for x in batch.responsible_templates
+                    for y in b.responsible_templates
+                )
+                for b in wave
+            ):
+                wave.append(batch)
+                break
+        else:
+            waves.append([batch])
+    return waves
+
+
 # =========================
 # Main Entry Point
 # =========================
 
-def batch_issues_adaptive(case: CaseType, issues: List[Issue]) -> List[Batch]:
+def batch_issues_adaptive(
+    case: CaseType,
+    issues: List[Issue],
+    token_budget: Optional[int] = None,
+    slice_for: Optional[SliceLookup] = None,
+    tokenizer: Optional[Tokenizer] = None,
+    templates: Optional[List[XSLTTemplate]] = None,
+) -> List[Batch]:
     """
     Monolithic XSLT-aware batching with adaptive merging/splitting.
     
@@ -208,6 +562,13 @@ def batch_issues_adaptive(case: CaseType, issues: List[Issue]) -> List[Batch]:
     - Start conservative (fine-grained batches)
     - Merge small related batches
     - Split oversized batches for LLM context window
+
+    With token_budget set, Phase 2 bin-packs batches up to the budget
+    (issue payload + responsible slice from slice_for) instead of
+    splitting on a fixed issue count.
+
+    With templates (xslt_analysis.analyze_templates) given, each batch
+    gets its responsible templates and batches sharing them are merged.
     """
     if not issues:
         return []
@@ -226,7 +587,13 @@ def batch_issues_adaptive(case: CaseType, issues: List[Issue]) -> List[Batch]:
     
     else:
         raise ValueError(f"Unknown case type: {case}")
+
+    if templates:
+        batches = merge_by_template(attach_templates(batches, templates))
     
+    if token_budget is not None:
+        return pack_batches(batches, token_budget, slice_for, tokenizer)
+
     # Phase 2: Split oversized batches
     final_batches = []
     MAX_ISSUES_PER_BATCH = 20  # Tune based on LLM context window
@@ -238,7 +605,7 @@ def batch_issues_adaptive(case: CaseType, issues: List[Issue]) -> List[Batch]:
         else:
             final_batches.append(batch)
     
-    return final_batches
+    return annotate_tokens(final_batches, slice_for, tokenizer)
 
 
 # =========================
@@ -277,4 +644,5 @@ if __name__ == "__main__":
             print(f"  Batch {i}:")
             print(f"    Root: {batch.batch_root}")
             print(f"    Issues: {len(batch.issues)}")
+            print(f"    Tokens: ~{batch.estimated_tokens}")
             print(f"    History: {batch.history}")
\ No newline at end of file
@@ -0,0 +1,89 @@
+"""
+ast.literal_eval loader vs diff_loader on a synthetic diff dump.
+With --jsonl the baseline is a plain json.loads loop instead.
+
+Builds an N-line file by cycling the records of spec_diffs.txt and
+diffs.txt (with varied counts), then times each loader and the Python
+heap it retains.
+
+    python -m benchmarks.bench_diff_loader [--lines 100000] [--jsonl]
+"""
+import argparse
+import ast
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from diff_loader import iter_diff_records, iter_diff_slots, load_columns
+
+
+def literal_eval_loader(path):
+    """The original new.parse_diff loop."""
+    data = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                data.append(ast.literal_eval(line))
+    return data
+
+
+def json_loader(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def synth_file(lines, jsonl, sources=("spec_diffs.txt", "diffs.txt")):
+    seeds = []
+    for src in sources:
+        with open(src, encoding="utf-8") as f:
+            seeds.extend(ast.literal_eval(l) for l in f if l.strip())
+
+    fd, path = tempfile.mkstemp(suffix=".jsonl" if jsonl else ".txt")
+    with os.fdopen(fd, "w", encoding="utf-8") as out:
+        for i in range(lines):
+            rec = dict(seeds[i % len(seeds)])
+            rec["output_count"] = i % 97
+            out.write((json.dumps(rec) if jsonl else repr(rec)) + "\n")
+    return path
+
+
+LOADERS = {
+    "baseline": None,
+    "dicts": lambda p: list(iter_diff_records(p)),
+    "slots": lambda p: list(iter_diff_slots(p)),
+    "columns": load_columns,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--lines", type=int, default=100_000)
+    parser.add_argument("--jsonl", action="store_true")
+    args = parser.parse_args()
+
+    loaders = dict(LOADERS)
+    loaders["baseline"] = json_loader if args.jsonl else literal_eval_loader
+
+    path = synth_file(args.lines, args.jsonl)
+    try:
+        for name, loader in loaders.items():
+            start = time.perf_counter()
+            loader(path)
+            elapsed = time.perf_counter() - start
+
+            tracemalloc.start()
+            result = loader(path)
+            retained, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            del result
+
+            print(f"{name:13s} {elapsed:7.2f} s   {retained / 2**20:8.1f} MiB retained")
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Snapshot (deepcopy) vs PatchLog rollback on initial.xslt.
+
+Replays the refine_xslt commit/rollback pattern over every xsl:for-each
+in the stylesheet, rejecting every third fix. Each mode runs in a fresh
+process so peak RSS is comparable.
+
+    python -m benchmarks.bench_patching [--xslt initial.xslt] [--rounds 20]
+"""
+import argparse
+import multiprocessing as mp
+import resource
+import time
+from copy import deepcopy
+
+from lxml import etree
+
+from patching import PatchLog
+
+XSL_NS = "http://www.w3.org/1999/XSL/Transform"
+
+
+def candidate_for(node):
+    fixed = deepcopy(node)
+    fixed.append(etree.Comment("fixed"))
+    return fixed
+
+
+def route(node):
+    path = []
+    parent = node.getparent()
+    while parent is not None:
+        path.append(parent.index(node))
+        node, parent = parent, parent.getparent()
+    return path[::-1]
+
+
+def follow(root, path):
+    for i in path:
+        root = root[i]
+    return root
+
+
+def run_snapshot(xslt_root):
+    """The pre-PatchLog refine_xslt pattern."""
+    snapshot = deepcopy(xslt_root)
+    loops = [route(n) for n in xslt_root.iter(f"{{{XSL_NS}}}for-each")]
+
+    for i, path in enumerate(loops):
+        loop_node = follow(xslt_root, path)
+        new_loop = candidate_for(loop_node)
+
+        test_root = deepcopy(xslt_root)
+        test_loop = follow(test_root, path)
+        test_loop.getparent().replace(test_loop, new_loop)
+
+        if i % 3 == 2:
+            xslt_root = deepcopy(snapshot)
+            continue
+
+        loop_node.getparent().replace(loop_node, new_loop)
+        snapshot = deepcopy(xslt_root)
+
+
+def run_patchlog(xslt_root):
+    patches = PatchLog()
+    loops = [route(n) for n in xslt_root.iter(f"{{{XSL_NS}}}for-each")]
+
+    for i, path in enumerate(loops):
+        loop_node = follow(xslt_root, path)
+        patches.apply(loop_node, candidate_for(loop_node))
+
+        if i % 3 == 2:
+            patches.rollback()
+        else:
+            patches.commit()
+
+
+MODES = {"snapshot": run_snapshot, "patchlog": run_patchlog}
+
+
+def measure(mode, xslt_path, rounds, out):
+    xslt_text = open(xslt_path, encoding="utf-8").read()
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        MODES[mode](etree.XML(xslt_text.encode()))
+    elapsed = time.perf_counter() - start
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    out.put((mode, elapsed / rounds, peak - base_rss))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--xslt", default="initial.xslt")
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    ctx = mp.get_context("spawn")
+    out = ctx.Queue()
+    for mode in MODES:
+        proc = ctx.Process(target=measure, args=(mode, args.xslt, args.rounds, out))
+        proc.start()
+        proc.join()
+        mode, per_round, rss_kb = out.get()
+        print(f"{mode:10s} {per_round * 1000:9.2f} ms/run   +{rss_kb:7d} KB peak RSS")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Stage timings of the repair pipeline on a synthetic monolithic XSLT.
+
+Generates a case with benchmarks.synth (thousands of templates with
+nested for-each blocks), then times compile, run_xslt, diff_xml,
+collapse_diffs, count_diffs, group_diffs_by_anchor, locate_best_node,
+batch_issues_adaptive and a full refine_xslt with a stubbed LLM (broken
+down by instrument stage: locate, prompt, llm, merge, validate).
+Positional diffs are collapsed with diff_cluster before batching.
+Each stage reports the best of --repeat runs and is compared with the
+stored baseline.
+
+    python -m benchmarks.bench_pipeline [--templates 1000] [--bugs 50]
+    python -m benchmarks.bench_pipeline --save-baseline
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from batcher import batch_issues_adaptive
+from diff_cluster import collapse_diffs, issues_by_case
+from instrument import profile_run
+from new import group_diffs_by_anchor, locate_best_node, parse_xslt, refine_xslt
+from output_index import OutputIndex
+from xml_diff import count_diffs, diff_xml
+from xslt_runner import clear_caches, compile_xslt, run_xslt
+
+from benchmarks.synth import make_case
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline_pipeline.json")
+
+
+def stub_llm(latency: float = 0.0):
+    """Echo the prompt's snippet back with a marker comment."""
+    def llm(prompt):
+        if latency:
+            time.sleep(latency)
+        snippet = prompt.split("```xml\n")[1].split("```")[0]
+        return snippet.replace(">", "><!--fixed-->", 1)
+    return llm
+
+
+def best_of(repeat, fn):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_stages(case, repeat, latency):
+    stages = {}
+
+    def compile_cold():
+        clear_caches()
+        compile_xslt(case.xslt)
+
+    stages["compile"] = best_of(repeat, compile_cold)
+    compile_xslt(case.xslt)
+    stages["run_xslt"] = best_of(repeat, lambda: run_xslt(case.xslt, case.input_xml))
+
+    output = run_xslt(case.xslt, case.input_xml)
+    stages["diff_xml"] = best_of(repeat, lambda: diff_xml(output, case.target_xml))
+    instance_diffs = diff_xml(output, case.target_xml)
+    stages["collapse_diffs"] = best_of(repeat, lambda: collapse_diffs(instance_diffs))
+    stages["count_diffs"] = best_of(repeat, lambda: count_diffs(output, case.target_xml))
+
+    stages["group_diffs_by_anchor"] = best_of(
+        repeat, lambda: group_diffs_by_anchor(case.diffs)
+    )
+    anchors = list(group_diffs_by_anchor(case.diffs))
+    xslt_root = parse_xslt(case.xslt)
+
+    def locate_all():
+        index = OutputIndex(xslt_root)
+        for anchor in anchors:
+            locate_best_node(xslt_root, anchor, index)
+
+    stages["locate_best_node"] = best_of(repeat, locate_all)
+
+    issues = issues_by_case(collapse_diffs(instance_diffs))
+    stages["batch_issues_adaptive"] = best_of(
+        repeat,
+        lambda: [batch_issues_adaptive(c, i) for c, i in issues.items()],
+    )
+
+    llm = stub_llm(latency)
+    with profile_run() as recorder:
+        start = time.perf_counter()
+        refine_xslt(case.xslt, case.diffs, llm=llm)
+        stages["refine_xslt"] = time.perf_counter() - start
+    for name, stats in recorder.report()["stages"].items():
+        stages[f"refine_xslt.{name}"] = stats["total_s"]
+
+    return stages
+
+
+def compare(stages, baseline, tolerance, min_delta):
+    """Stages slower than baseline by more than tolerance (and min_delta s)."""
+    regressions = []
+    for name, seconds in stages.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if seconds > base * (1 + tolerance) and seconds - base > min_delta:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--templates", type=int, default=1000)
+    parser.add_argument("--depth", type=int, default=2, help="nested for-each levels")
+    parser.add_argument("--rows", type=int, default=3, help="children per loop level")
+    parser.add_argument("--bugs", type=int, default=50, help="sections with injected bugs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="stub LLM delay (s)")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--min-delta", type=float, default=0.005)
+    args = parser.parse_args()
+
+    params = {k: getattr(args, k) for k in ("templates", "depth", "rows", "bugs", "seed")}
+    start = time.perf_counter()
+    case = make_case(**params)
+    print(
+        f"case: {len(case.xslt) / 2**20:.1f} MiB xslt, "
+        f"{len(case.input_xml) / 2**20:.1f} MiB input, {len(case.diffs)} diffs "
+        f"({time.perf_counter() - start:.1f} s to generate)"
+    )
+
+    stages = run_stages(case, args.repeat, args.llm_latency)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            saved = json.load(f)
+        if saved.get("params") == params:
+            baseline = saved["stages"]
+        else:
+            print(f"baseline {args.baseline} was recorded with {saved.get('params')}; not comparing")
+
+    for name, seconds in stages.items():
+        base = baseline.get(name)
+        ratio = f"{seconds / base:6.2f}x" if base else "      "
+        print(f"{name:32s} {seconds * 1000:10.2f} ms  {ratio}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"params": params, "stages": stages}, f, indent=2)
+            f.write("\n")
+        print(f"baseline written to {args.baseline}")
+        return
+
+    slower = compare(stages, baseline, args.tolerance, args.min_delta)
+    if slower:
+        print(f"regressions (> {args.tolerance:.0%} over baseline): {', '.join(slower)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Synthetic monolithic stylesheets, inputs, targets and diff sets.
+
+make_case() builds a "correct" stylesheet with one named template per
+section (nested xsl:for-each blocks inside), a matching input document,
+the target produced by the correct stylesheet, and a buggy copy of the
+stylesheet with MISSING / EXTRA / COUNT_MISMATCH bugs injected into
+`bugs` sections. The diff set is count_diffs(buggy output, target) in
+spec_diffs.txt form.
+"""
+import random
+from dataclasses import dataclass
+from typing import Dict, List
+
+from xml_diff import count_diffs
+from xslt_runner import run_xslt
+
+XSL_NS = "http://www.w3.org/1999/XSL/Transform"
+
+BUG_KINDS = ("MISSING", "EXTRA", "COUNT_MISMATCH")
+
+
+@dataclass
+class SynthCase:
+    xslt: str          # buggy stylesheet to repair
+    fixed_xslt: str    # stylesheet the target was produced with
+    input_xml: str
+    target_xml: str
+    diffs: List[Dict]  # spec_diffs.txt-style records
+
+
+def _items_block(i, bug, ind):
+    fee = "" if bug == "MISSING" else f"{ind}      <Fee>1</Fee>\n"
+    extra = f"{ind}      <Debug>x</Debug>\n" if bug == "EXTRA" else ""
+    value = f'{ind}      <Value><xsl:value-of select="A"/></Value>\n'
+    if bug == "COUNT_MISMATCH":
+        value *= 2
+    return (
+        f'{ind}<xsl:for-each select="I">\n'
+        f"{ind}  <Item{i}>\n"
+        f'{ind}    <Code><xsl:value-of select="C"/></Code>\n'
+        f"{ind}    <Pricing>\n"
+        f"{value}{fee}{extra}"
+        f"{ind}    </Pricing>\n"
+        f"{ind}  </Item{i}>\n"
+        f"{ind}</xsl:for-each>\n"
+    )
+
+
+def _loop_block(i, level, depth, bug, ind):
+    if level == depth:
+        return _items_block(i, bug, ind)
+    return (
+        f'{ind}<xsl:for-each select="N">\n'
+        f"{ind}  <Node{i}_{level}>\n"
+        f'{ind}    <Label><xsl:value-of select="@id"/></Label>\n'
+        + _loop_block(i, level + 1, depth, bug, ind + "    ")
+        + f"{ind}  </Node{i}_{level}>\n"
+        f"{ind}</xsl:for-each>\n"
+    )
+
+
+def make_xslt(templates: int, depth: int, bugs: Dict[int, str] = None) -> str:
+    bugs = bugs or {}
+    parts = [
+        '<?xml version="1.0" encoding="UTF-8"?>\n',
+        f'<xsl:stylesheet version="1.0" xmlns:xsl="{XSL_NS}">\n',
+        '  <xsl:output method="xml" indent="yes"/>\n',
+        '  <xsl:template match="/">\n',
+        "    <Root>\n",
+    ]
+    parts += [f'      <xsl:call-template name="sec{i}"/>\n' for i in range(templates)]
+    parts += ["    </Root>\n", "  </xsl:template>\n"]
+
+    for i in range(templates):
+        parts.append(f'  <xsl:template name="sec{i}">\n')
+        parts.append(f"    <Section{i}>\n")
+        parts.append(f'      <xsl:for-each select="/Input/S{i}">\n')
+        parts.append(_loop_block(i, 1, depth, bugs.get(i), "        "))
+        parts.append("      </xsl:for-each>\n")
+        parts.append(f"    </Section{i}>\n")
+        parts.append("  </xsl:template>\n")
+
+    parts.append("</xsl:stylesheet>\n")
+    return "".join(parts)
+
+
+def make_input(templates: int, depth: int, rows: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+
+    def level(n):
+        if n == depth:
+            return "".join(
+                f"<I><C>C{rng.randint(0, 999)}</C><A>{rng.randint(1, 500)}</A></I>"
+                for _ in range(rows)
+            )
+        return "".join(f'<N id="{k}">{level(n + 1)}</N>' for k in range(rows))
+
+    body = "".join(f"<S{i}>{level(1)}</S{i}>" for i in range(templates))
+    return f"<Input>{body}</Input>"
+
+
+def as_spec_diffs(records: List[Dict]) -> List[Dict]:
+    return [
+        {
+            "output_xpath": r["xpath"],
+            "diff_type": r["diff_type"],
+            "output_count": r["output_count"],
+            "target_count": r["target_count"],
+            "issue_category": "",
+            "in_specs": True,
+            "in_target": r["in_target"],
+            "in_output": r["in_output"],
+            "remarks": "",
+            "expected_source_path": "",
+        }
+        for r in records
+    ]
+
+
+def make_case(
+    templates: int = 1000, depth: int = 2, rows: int = 3, bugs: int = 50, seed: int = 0
+) -> SynthCase:
+    rng = random.Random(seed)
+    buggy = {
+        i: BUG_KINDS[k % len(BUG_KINDS)]
+        for k, i in enumerate(sorted(rng.sample(range(templates), min(bugs, templates))))
+    }
+
+    fixed_xslt = make_xslt(templates, depth)
+    xslt = make_xslt(templates, depth, buggy)
+    input_xml = make_input(templates, depth, rows, seed)
+    target_xml = run_xslt(fixed_xslt, input_xml)
+    diffs = as_spec_diffs(count_diffs(run_xslt(xslt, input_xml), target_xml))
+    return SynthCase(xslt, fixed_xslt, input_xml, target_xml, diffs)
@@ -0,0 +1,80 @@
+"""
+On-disk checkpoints for long refine_xslt runs.
+
+A checkpoint holds the current stylesheet, the anchors already fixed and
+the anchors still to visit. It is written atomically (temp file, fsync,
+rename) so a crash mid-write leaves the previous checkpoint intact.
+"""
+import hashlib
+import json
+import os
+import tempfile
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+CHECKPOINT_VERSION = 1
+
+
+@dataclass
+class RunCheckpoint:
+    xslt: str
+    locked: List[str] = field(default_factory=list)
+    pending: List[str] = field(default_factory=list)
+    # Fingerprint of the diff set the run was started with
+    diffs_key: str = ""
+    version: int = CHECKPOINT_VERSION
+
+
+def diff_fingerprint(diffs: List[Dict]) -> str:
+    h = hashlib.sha256()
+    for d in diffs:
+        h.update(json.dumps(d, sort_keys=True, default=str).encode("utf-8"))
+        h.update(b"\n")
+    return h.hexdigest()
+
+
+def save_checkpoint(path: str, checkpoint: RunCheckpoint):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(
+        prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory
+    )
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(asdict(checkpoint), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+
+    # Make the rename itself durable
+    if hasattr(os, "O_DIRECTORY"):
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+def load_checkpoint(path: str, diffs: Optional[List[Dict]] = None) -> Optional[RunCheckpoint]:
+    """
+    Read the checkpoint at path, or None if there is none. When diffs are
+    given, a checkpoint taken for a different diff set is refused.
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+
+    if data.get("version") != CHECKPOINT_VERSION:
+        raise ValueError(f"Unsupported checkpoint version: {data.get('version')}")
+
+    checkpoint = RunCheckpoint(**data)
+    if diffs is not None and checkpoint.diffs_key != diff_fingerprint(diffs):
+        raise ValueError(f"Checkpoint {path} was taken for a different diff set")
+    return checkpoint
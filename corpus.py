@@ -0,0 +1,187 @@
+"""
+Multi-input corpus regression runner.
+
+A corpus is a directory of input/target pairs, either
+
+    corpus/input/<name>.xml   +  corpus/target/<name>.xml
+or
+    corpus/<name>.input.xml   +  corpus/<name>.target.xml
+
+Pairs are sharded over a ProcessPoolExecutor; each worker compiles the
+stylesheet once and diffs every output of its shard against the target
+with xml_diff path counts.
+"""
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from lxml import etree
+
+from xml_diff import join_counts, path_counts
+from xslt_runner import compile_xslt
+
+
+@dataclass(frozen=True)
+class CorpusPair:
+    name: str
+    input_path: str
+    target_path: str
+
+
+@dataclass
+class CorpusReport:
+    per_pair: Dict[str, List[Dict]] = field(default_factory=dict)
+    errors: Dict[str, str] = field(default_factory=dict)
+    # (xpath, diff_type) -> number of pairs showing that diff
+    histogram: Counter = field(default_factory=Counter)
+    # xpath -> counts summed over the corpus
+    output_counts: Counter = field(default_factory=Counter)
+    target_counts: Counter = field(default_factory=Counter)
+
+    @property
+    def clean(self) -> bool:
+        return not self.errors and not any(self.per_pair.values())
+
+
+def load_corpus(directory) -> List[CorpusPair]:
+    root = Path(directory)
+    pairs = []
+
+    if (root / "input").is_dir():
+        for inp in sorted((root / "input").glob("*.xml")):
+            tgt = root / "target" / inp.name
+            if tgt.exists():
+                pairs.append(CorpusPair(inp.stem, str(inp), str(tgt)))
+        return pairs
+
+    for inp in sorted(root.glob("*.input.xml")):
+        name = inp.name[: -len(".input.xml")]
+        tgt = root / f"{name}.target.xml"
+        if tgt.exists():
+            pairs.append(CorpusPair(name, str(inp), str(tgt)))
+    return pairs
+
+
+# Targets never change during a run; keep their histograms per worker
+_target_cache: Dict[str, Counter] = {}
+
+
+def _target_counts(path):
+    counts = _target_cache.get(path)
+    if counts is None:
+        counts = _target_cache[path] = path_counts(path)
+    return counts
+
+
+def _run_shard(xslt_str, shard):
+    transform = compile_xslt(xslt_str)
+    results = {}
+    for pair in shard:
+        try:
+            output = transform(etree.parse(pair.input_path))
+            out = path_counts(bytes(output))
+            tgt = _target_counts(pair.target_path)
+            results[pair.name] = (join_counts(out, tgt), out, tgt, None)
+        except Exception as e:
+            results[pair.name] = (None, None, None, f"{type(e).__name__}: {e}")
+    return results
+
+
+def merge_results(shard_results) -> CorpusReport:
+    report = CorpusReport()
+    for results in shard_results:
+        for name, (records, out, tgt, error) in results.items():
+            if error is not None:
+                report.errors[name] = error
+                continue
+            report.per_pair[name] = records
+            report.output_counts.update(out)
+            report.target_counts.update(tgt)
+            for r in records:
+                report.histogram[(r["xpath"], r["diff_type"])] += 1
+    return report
+
+
+class CorpusRunner:
+    """Keeps a worker pool alive across corpus runs."""
+
+    def __init__(self, pairs: List[CorpusPair], workers: Optional[int] = None):
+        self.pairs = pairs
+        self.workers = max(1, min(workers or os.cpu_count() or 1, len(pairs)))
+        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+
+    def run(self, xslt) -> CorpusReport:
+        if not isinstance(xslt, str):
+            xslt = etree.tostring(xslt, encoding="unicode")
+        shards = [self.pairs[i::self.workers] for i in range(self.workers)]
+        futures = [
+            self._executor.submit(_run_shard, xslt, shard)
+            for shard in shards if shard
+        ]
+        return merge_results(f.result() for f in futures)
+
+    def close(self):
+        self._executor.shutdown(cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def run_corpus(xslt, pairs: List[CorpusPair], workers: Optional[int] = None) -> CorpusReport:
+    with CorpusRunner(pairs, workers) as runner:
+        return runner.run(xslt)
+
+
+def regressions(baseline: CorpusReport, candidate: CorpusReport) -> List[str]:
+    """
+    Per-pair regressions of candidate against baseline: new errors, new
+    diff paths, or paths whose output/target count gap grew. A pair that
+    errored in the baseline has nothing to compare against, so a
+    candidate that fixes the error is not held to its diffs.
+    """
+    found = []
+    for name in candidate.errors.keys() - baseline.errors.keys():
+        found.append(f"{name}: {candidate.errors[name]}")
+
+    for name, records in candidate.per_pair.items():
+        if name in baseline.errors:
+            continue
+        before = {r["xpath"]: r for r in baseline.per_pair.get(name, [])}
+        for r in records:
+            old = before.get(r["xpath"])
+            gap = abs(r["output_count"] - r["target_count"])
+            if old is None:
+                found.append(f"{name}: new {r['diff_type']} {r['xpath']}")
+            elif gap > abs(old["output_count"] - old["target_count"]):
+                found.append(f"{name}: worse {r['diff_type']} {r['xpath']}")
+    return found
+
+
+class CorpusGate:
+    """
+    accept() hook for refine_xslt: a candidate tree passes only if it
+    introduces no regression on any corpus pair. Accepted candidates
+    become the new baseline.
+    """
+
+    def __init__(self, pairs: List[CorpusPair], baseline_xslt, workers: Optional[int] = None):
+        self.runner = CorpusRunner(pairs, workers)
+        self.baseline = self.runner.run(baseline_xslt)
+        self.last_regressions: List[str] = []
+
+    def __call__(self, xslt_root) -> bool:
+        report = self.runner.run(xslt_root)
+        self.last_regressions = regressions(self.baseline, report)
+        if self.last_regressions:
+            return False
+        self.baseline = report
+        return True
+
+    def close(self):
+        self.runner.close()
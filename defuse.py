@@ -0,0 +1,121 @@
+"""
+Def-use index of xsl:variable / xsl:param over a stylesheet.
+
+Built in one pass: every definition by name, and every element whose
+attributes reference $names. References are resolved with XSLT 1.0
+scoping (a local binding is visible to its following siblings and their
+descendants; top-level bindings everywhere), so a slice can carry the
+exact transitive set of definitions it depends on. replace() keeps the
+index in sync when a subtree is swapped, as OutputIndex does.
+"""
+import re
+from typing import Dict, List, Optional, Tuple
+
+from lxml import etree
+
+from output_index import doc_order_key
+
+XSL_NS = "http://www.w3.org/1999/XSL/Transform"
+XSL = f"{{{XSL_NS}}}"
+BINDINGS = {XSL + "variable", XSL + "param"}
+
+_VAR_REF = re.compile(r"\$([A-Za-z_][\w.\-]*(?::[A-Za-z_][\w.\-]*)?)")
+_AVT = re.compile(r"\{([^{}]*)\}")
+
+
+def referenced_names(elem) -> Tuple[str, ...]:
+    """$names used in elem's attributes (only inside {..} on literal results)."""
+    names = []
+    is_xsl = elem.tag.startswith(XSL)
+    for value in elem.attrib.values():
+        if "$" not in value:
+            continue
+        parts = [value] if is_xsl else _AVT.findall(value)
+        for part in parts:
+            for name in _VAR_REF.findall(part):
+                if name not in names:
+                    names.append(name)
+    return tuple(names)
+
+
+class DefUseIndex:
+    def __init__(self, xslt_root: etree._Element):
+        self.root = xslt_root
+        self.globals: Dict[str, etree._Element] = {}
+        self.refs: Dict[etree._Element, Tuple[str, ...]] = {}
+        self._resolved: Dict[Tuple[etree._Element, str], Optional[etree._Element]] = {}
+        self._add_subtree(xslt_root)
+
+    def _add_subtree(self, top):
+        for elem in top.iter(etree.Element):
+            names = referenced_names(elem)
+            if names:
+                self.refs[elem] = names
+            if elem.tag in BINDINGS and elem.getparent() is self.root:
+                self.globals[elem.get("name")] = elem
+
+    def _remove_subtree(self, top):
+        for elem in top.iter(etree.Element):
+            self.refs.pop(elem, None)
+            if elem.tag in BINDINGS and self.globals.get(elem.get("name")) is elem:
+                del self.globals[elem.get("name")]
+
+    def replace(self, old_node, new_node):
+        """Re-index after new_node has taken old_node's place in the tree."""
+        self._remove_subtree(old_node)
+        self._add_subtree(new_node)
+        self._resolved.clear()
+
+    def definition(self, node, name: str) -> Optional[etree._Element]:
+        """The binding $name refers to when used on node."""
+        key = (node, name)
+        if key in self._resolved:
+            return self._resolved[key]
+
+        found = None
+        cur = node
+        while found is None and cur is not None and cur is not self.root:
+            parent = cur.getparent()
+            if parent is self.root:
+                break
+            for sib in cur.itersiblings(preceding=True):
+                if sib.tag in BINDINGS and sib.get("name") == name:
+                    found = sib
+                    break
+            cur = parent
+        if found is None:
+            found = self.globals.get(name)
+
+        self._resolved[key] = found
+        return found
+
+    def references(self, node) -> Dict[Tuple[etree._Element, str], Optional[etree._Element]]:
+        """Every (element, $name) in node's subtree and its definition."""
+        return {
+            (elem, name): self.definition(elem, name)
+            for elem in node.iter(etree.Element)
+            for name in self.refs.get(elem, ())
+        }
+
+    def dependencies(self, node) -> List[etree._Element]:
+        """
+        Definitions outside node that node's subtree uses, directly or
+        through other definitions, in document order.
+        """
+        inside = set(node.iter(etree.Element))
+        deps, seen = [], set()
+        stack = [node]
+        while stack:
+            for definition in self.references(stack.pop()).values():
+                if definition is None or definition in seen:
+                    continue
+                seen.add(definition)
+                if definition not in inside:
+                    deps.append(definition)
+                    stack.append(definition)
+        deps.sort(key=doc_order_key)
+        return deps
+
+    def unresolved(self, node) -> List[str]:
+        """$names used in node's subtree with no visible definition."""
+        return sorted({name for (_, name), d in self.references(node).items() if d is None})
@@ -1,6 +1,96 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from batcher import Batch, Issue, batch_issues_adaptive
+from xml_diff import diff_path, unindexed
+
+# Sample instance paths kept per pattern for the prompt
+MAX_SAMPLES = 3
+
+# Batching case per diff type; VALUE_MISMATCH has no batching case
+CASE_FOR = {"MISSING": "A", "COUNT_MISMATCH": "B", "EXTRA": "C"}
+
+
+def normalize_xpath(xpath: str) -> str:
+    """'/ns:Items[1]/Item[3]/Price[1]' -> '/Items/Item/Price'"""
+    return unindexed(xpath)
+
+
+@dataclass
+class PatternIssue:
+    """All diffs of one type at one path pattern."""
+    pattern: str
+    diff_type: str
+    occurrences: int = 0
+    sample_positions: List[str] = field(default_factory=list)
+    # Summed counts when built from count_diffs / spec_diffs records
+    output_count: Optional[int] = None
+    target_count: Optional[int] = None
+
+    def to_issue(self) -> Optional[Issue]:
+        case = CASE_FOR.get(self.diff_type)
+        if case is None:
+            return None
+        if self.output_count is not None:
+            expected, observed = self.target_count, self.output_count
+        elif case == "A":
+            expected, observed = self.occurrences, 0
+        elif case == "C":
+            expected, observed = None, self.occurrences
+        else:
+            expected, observed = None, None
+        return Issue(
+            case, self.pattern, expected, observed,
+            occurrences=self.occurrences,
+            sample_positions=tuple(self.sample_positions),
+        )
+
+
+def collapse_diffs(diffs, max_samples: int = MAX_SAMPLES) -> List[PatternIssue]:
+    """
+    Fold per-instance diffs (models.Diff or diff record dicts) into one
+    PatternIssue per (normalized path, diff type), in first-seen order.
+    """
+    patterns: Dict[tuple, PatternIssue] = {}
+    for d in diffs:
+        xpath = diff_path(d)
+        diff_type = d["diff_type"] if isinstance(d, dict) else d.diff_type
+        key = (normalize_xpath(xpath), diff_type)
+
+        p = patterns.get(key)
+        if p is None:
+            p = patterns[key] = PatternIssue(*key)
+        p.occurrences += 1
+        if len(p.sample_positions) < max_samples and xpath != key[0]:
+            p.sample_positions.append(xpath)
+
+        if isinstance(d, dict) and "output_count" in d:
+            p.output_count = (p.output_count or 0) + d["output_count"]
+            p.target_count = (p.target_count or 0) + d["target_count"]
+
+    return list(patterns.values())
+
+
+def issues_by_case(patterns: List[PatternIssue]) -> Dict[str, List[Issue]]:
+    by_case: Dict[str, List[Issue]] = {}
+    for p in patterns:
+        issue = p.to_issue()
+        if issue is not None:
+            by_case.setdefault(issue.case, []).append(issue)
+    return by_case
+
+
+def batch_patterns(patterns: List[PatternIssue], **kwargs) -> List[Batch]:
+    """batch_issues_adaptive over every case; kwargs are passed through."""
+    batches = []
+    for case, issues in issues_by_case(patterns).items():
+        batches.extend(batch_issues_adaptive(case, issues, **kwargs))
+    return batches
+
+
 def cluster_diffs(diffs):
     clusters = {}
     for d in diffs:
-        root = "/".join(d.xpath.split("/")[:3])
+        root = "/".join(normalize_xpath(d.xpath).split("/")[:3])
         clusters.setdefault(root, []).append(d)
     return sorted(clusters.values(), key=len, reverse=True)
@@ -0,0 +1,169 @@
+import ast
+import json
+import sys
+
+# Keys whose string values repeat heavily across a dump
+INTERNED_KEYS = frozenset({
+    "xpath", "output_xpath", "diff_type", "issue_category",
+    "remarks", "expected_source_path",
+})
+
+_PY_CONSTS = (("': True", "': true"), ("': False", "': false"), ("': None", "': null"))
+
+
+def _literal_as_json(line):
+    """
+    Rewrite a Python dict repr as JSON when that is unambiguous: with no
+    double quotes or backslashes, every single quote is a string
+    delimiter and True/False/None can only follow a key. Returns None
+    when the line needs the slow path.
+    """
+    if '"' in line or "\\" in line:
+        return None
+    for py, js in _PY_CONSTS:
+        line = line.replace(py, js)
+    return line.replace("'", '"')
+
+
+def parse_record(line):
+    """
+    Parse one diff line: JSON object, or Python dict literal as in
+    diffs.txt / spec_diffs.txt. Raises ValueError on malformed input.
+    """
+    if line[1:2] == '"' or line[1:3] == ' "':
+        candidate = line
+    else:
+        candidate = _literal_as_json(line)
+    if candidate is not None:
+        try:
+            record = json.loads(candidate)
+        except ValueError:
+            record = None
+        if isinstance(record, dict):
+            return record
+    try:
+        record = ast.literal_eval(line)
+    except (ValueError, SyntaxError) as e:
+        raise ValueError(str(e)) from None
+    if not isinstance(record, dict):
+        raise ValueError("not a dict record")
+    return record
+
+
+def _intern(record):
+    out = {}
+    for k, v in record.items():
+        if k in INTERNED_KEYS and isinstance(v, str):
+            v = sys.intern(v)
+        out[sys.intern(k)] = v
+    return out
+
+
+def iter_diff_records(file_path, intern=True, on_error=None):
+    """
+    Stream diff records from a diffs.txt-style or JSONL file.
+    Malformed lines are skipped; on_error(line, exc) is called for each.
+    """
+    with open(file_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = parse_record(line)
+            except ValueError as e:
+                if on_error is not None:
+                    on_error(line, e)
+                continue
+            yield _intern(record) if intern else record
+
+
+# ============================================================
+# Compact representations
+# ============================================================
+
+_FIELDS = (
+    "xpath", "diff_type", "output_count", "target_count",
+    "issue_category", "in_specs", "in_target", "in_output",
+    "remarks", "expected_source_path",
+)
+_XPATH_KEYS = ("xpath", "output_xpath")
+
+
+class DiffRecord:
+    """
+    __slots__ form of a diff record. Supports d["key"] / d.get() so it
+    can stand in for the dicts used throughout new.py; "xpath" and
+    "output_xpath" are aliases for the same slot.
+    """
+    __slots__ = _FIELDS + ("xpath_key", "extra")
+
+    def __init__(self, record):
+        self.xpath_key = "output_xpath" if "output_xpath" in record else "xpath"
+        self.extra = None
+        for name in _FIELDS:
+            setattr(self, name, None)
+        for k, v in record.items():
+            if k in _XPATH_KEYS:
+                self.xpath = v
+            elif k in _FIELDS:
+                setattr(self, k, v)
+            else:
+                if self.extra is None:
+                    self.extra = {}
+                self.extra[k] = v
+
+    def __getitem__(self, key):
+        if key in _XPATH_KEYS:
+            return self.xpath
+        if key in _FIELDS:
+            return getattr(self, key)
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def to_dict(self):
+        d = {self.xpath_key: self.xpath}
+        for name in _FIELDS[1:]:
+            value = getattr(self, name)
+            if value is not None:
+                d[name] = value
+        if self.extra:
+            d.update(self.extra)
+        return d
+
+    def __repr__(self):
+        return f"DiffRecord({self.to_dict()!r})"
+
+
+def iter_diff_slots(file_path, on_error=None):
+    for record in iter_diff_records(file_path, on_error=on_error):
+        yield DiffRecord(record)
+
+
+def load_columns(file_path, on_error=None):
+    """
+    Columnar form: {key: [value per record]}, None where a record
+    lacks the key. output_xpath is folded into xpath.
+    """
+    columns = {}
+    n = 0
+    for record in iter_diff_records(file_path, on_error=on_error):
+        if "output_xpath" in record:
+            record["xpath"] = record.pop("output_xpath")
+        for k, v in record.items():
+            col = columns.get(k)
+            if col is None:
+                col = columns[k] = [None] * n
+            col.append(v)
+        n += 1
+        for col in columns.values():
+            if len(col) < n:
+                col.append(None)
+    return columns
@@ -0,0 +1,176 @@
+"""
+Stage timing for the repair pipeline.
+
+    with profile_run("run.json", cprofile_path="run.prof"):
+        refine_xslt(...)
+
+Inside profile_run every span("compile" | "transform" | "diff" | "locate"
+| "prompt" | "llm" | "merge" | "validate") is timed and aggregated into
+a per-stage JSON report. Outside it span() returns a shared no-op and
+timed() calls straight through, so instrumented code pays one global
+lookup.
+"""
+import cProfile
+import functools
+import json
+import threading
+import time
+from typing import Dict, List, Optional
+
+STAGES = ("compile", "transform", "diff", "locate", "prompt", "llm", "merge", "validate")
+
+# Individual spans kept in the report; stage totals are always complete
+MAX_SPANS = 10000
+
+
+class StageStats:
+    __slots__ = ("count", "total", "min", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def add(self, elapsed: float):
+        self.count += 1
+        self.total += elapsed
+        self.min = min(self.min, elapsed)
+        self.max = max(self.max, elapsed)
+
+    def to_dict(self) -> Dict:
+        return {
+            "count": self.count,
+            "total_s": round(self.total, 6),
+            "mean_s": round(self.total / self.count, 6) if self.count else 0.0,
+            "min_s": round(self.min, 6) if self.count else 0.0,
+            "max_s": round(self.max, 6),
+        }
+
+
+class Recorder:
+    """Collects spans from any thread for one run."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, StageStats] = {}
+        self.spans: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, start: float, elapsed: float, attrs: Dict):
+        with self._lock:
+            stats = self.stages.get(stage)
+            if stats is None:
+                stats = self.stages[stage] = StageStats()
+            stats.add(elapsed)
+            if len(self.spans) < MAX_SPANS:
+                self.spans.append({
+                    "stage": stage,
+                    "start_s": round(start - self.started, 6),
+                    "elapsed_s": round(elapsed, 6),
+                    **attrs,
+                })
+
+    def report(self) -> Dict:
+        with self._lock:
+            return {
+                "wall_s": round(time.perf_counter() - self.started, 6),
+                "stages": {name: s.to_dict() for name, s in self.stages.items()},
+                "spans": list(self.spans),
+            }
+
+
+_active: Optional[Recorder] = None
+
+
+class _Span:
+    __slots__ = ("recorder", "stage", "attrs", "start")
+
+    def __init__(self, recorder, stage, attrs):
+        self.recorder = recorder
+        self.stage = stage
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.recorder.record(
+            self.stage, self.start, time.perf_counter() - self.start, self.attrs
+        )
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(stage: str, **attrs):
+    """Context manager timing one occurrence of stage."""
+    recorder = _active
+    if recorder is None:
+        return _NULL_SPAN
+    return _Span(recorder, stage, attrs)
+
+
+def timed(stage: str):
+    """Decorator form of span() for a whole function call."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            recorder = _active
+            if recorder is None:
+                return fn(*args, **kwargs)
+            with _Span(recorder, stage, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def active() -> Optional[Recorder]:
+    return _active
+
+
+class profile_run:
+    """
+    Enable span recording for the duration of the block. On exit the
+    report is written to report_path (JSON) and, if cprofile_path is
+    given, a cProfile dump of the block to that file.
+    """
+
+    def __init__(self, report_path: Optional[str] = None, cprofile_path: Optional[str] = None):
+        self.report_path = report_path
+        self.cprofile_path = cprofile_path
+        self.recorder = Recorder()
+        self._previous = None
+        self._profiler = None
+
+    def __enter__(self) -> Recorder:
+        global _active
+        self._previous = _active
+        _active = self.recorder
+        if self.cprofile_path:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        return self.recorder
+
+    def __exit__(self, *exc):
+        global _active
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler.dump_stats(self.cprofile_path)
+        _active = self._previous
+        if self.report_path:
+            with open(self.report_path, "w", encoding="utf-8") as f:
+                json.dump(self.recorder.report(), f, indent=2)
+        return False
@@ -0,0 +1,184 @@
+"""
+Execution-based knockout validation.
+
+Runs a (patched) stylesheet against sample inputs in a pool of worker
+processes and checks that every diff's output path is now produced
+target_count times. Each worker keeps compiled transforms in the
+xslt_runner cache, so a stylesheet is compiled once per worker.
+"""
+import multiprocessing
+import os
+import signal
+from concurrent.futures import ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from lxml import etree
+
+from xml_diff import path_counts, unindexed
+from xslt_runner import compile_xslt, run_xslt
+
+
+@dataclass
+class Sample:
+    """One input document and the diffs recorded against it."""
+    name: str
+    input_xml: str
+    diffs: List[Dict] = field(default_factory=list)
+
+
+@dataclass
+class DiffCheck:
+    xpath: str
+    sample: str
+    expected: int
+    observed: Optional[int]
+    status: str  # PASS, FAIL, ERROR, TIMEOUT
+    detail: str = ""
+
+    @property
+    def passed(self) -> bool:
+        return self.status == "PASS"
+
+
+# Windows has no SIGKILL; TerminateProcess is used for both there
+_KILL = getattr(signal, "SIGKILL", signal.SIGTERM)
+
+
+def _warm(xslt_strs, started=None):
+    if started is not None:
+        started.put(os.getpid())
+    for xslt_str in xslt_strs:
+        compile_xslt(xslt_str)
+
+
+def _output_counts(xslt_str, input_xml):
+    try:
+        return path_counts(run_xslt(xslt_str, input_xml))
+    except etree.Error as e:
+        # lxml errors carry an unpicklable error log
+        raise RuntimeError(f"{type(e).__name__}: {e}") from None
+
+
+class TransformPool:
+    """
+    Long-lived worker processes that run stylesheets on inputs.
+    preload stylesheets are compiled in every worker at start-up.
+    Workers report their pid from the initializer so terminate() can
+    kill them.
+    """
+
+    def __init__(self, workers: Optional[int] = None, preload=()):
+        self.workers = workers or os.cpu_count() or 1
+        self.preload = tuple(preload)
+        self._executor = self._start()
+
+    def _start(self):
+        context = multiprocessing.get_context()
+        self._started = context.SimpleQueue()
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=_warm,
+            initargs=(self.preload, self._started),
+        )
+
+    def _worker_pids(self) -> List[int]:
+        pids = []
+        while not self._started.empty():
+            pids.append(self._started.get())
+        return pids
+
+    def submit_counts(self, xslt_str: str, input_xml: str):
+        return self._executor.submit(_output_counts, xslt_str, input_xml)
+
+    def terminate(self):
+        """
+        Kill the workers outright. A running transform cannot be
+        cancelled, so this is the only way to free a worker stuck in a
+        runaway stylesheet; futures still pending fail.
+        """
+        pids = self._worker_pids()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        for pid in pids:
+            try:
+                os.kill(pid, _KILL)
+            except ProcessLookupError:
+                pass
+
+    def restart(self):
+        """terminate() and start fresh workers."""
+        self.terminate()
+        self._executor = self._start()
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def knockout_validate(
+    xslt,
+    samples: List[Sample],
+    pool: Optional[TransformPool] = None,
+    time_budget: Optional[float] = None,
+) -> List[DiffCheck]:
+    """
+    Run xslt (text or live tree) on every sample and report, per diff,
+    whether the output path count now equals the diff's target_count.
+    Samples not finished within time_budget seconds report TIMEOUT, and
+    the pool's workers are replaced so the stuck transforms do not hold
+    them for later calls.
+    """
+    if not isinstance(xslt, str):
+        xslt = etree.tostring(xslt, encoding="unicode")
+
+    own_pool = pool is None
+    pool = pool or TransformPool(min(len(samples), os.cpu_count() or 1) or 1)
+    timed_out = False
+    try:
+        futures = {pool.submit_counts(xslt, s.input_xml): s for s in samples}
+        done, not_done = wait(futures, timeout=time_budget)
+        timed_out = bool(not_done)
+
+        checks = []
+        for fut, sample in futures.items():
+            if fut not in done:
+                checks.extend(_report(sample, None, "TIMEOUT", "time budget exceeded"))
+                continue
+            try:
+                counts = fut.result()
+            except Exception as e:
+                checks.extend(_report(sample, None, "ERROR", str(e)))
+                continue
+            checks.extend(_report(sample, counts))
+        return checks
+    finally:
+        if timed_out and own_pool:
+            pool.terminate()
+        elif timed_out:
+            pool.restart()
+        elif own_pool:
+            pool.close()
+
+
+def _report(sample, counts, status=None, detail=""):
+    for d in sample.diffs:
+        xpath = d.get("output_xpath") or d["xpath"]
+        expected = d["target_count"]
+        if counts is None:
+            yield DiffCheck(xpath, sample.name, expected, None, status, detail)
+            continue
+        observed = counts.get(unindexed(xpath), 0)
+        yield DiffCheck(
+            xpath, sample.name, expected, observed,
+            "PASS" if observed == expected else "FAIL",
+        )
+
+
+def all_passed(checks: List[DiffCheck]) -> bool:
+    return all(c.passed for c in checks)
@@ -0,0 +1,248 @@
+"""
+Persistent, content-addressed cache of LLM responses.
+
+Prompts built by new.build_prompt / slicer.prompt_t are deterministic,
+so a rerun of refine_xslt asks the same questions again. Responses are
+stored in SQLite keyed by a hash of the normalized prompt plus the model
+parameters; only prompts that changed reach the LLM. The database is
+bounded by total response size, evicting least recently used entries.
+
+A response is only stored once the caller settles it as accepted (for
+refine_xslt: the fix was committed), so a rejected fix is asked again
+on the next run instead of being replayed.
+"""
+import functools
+import hashlib
+import inspect
+import json
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, Optional
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key       TEXT PRIMARY KEY,
+    response  TEXT NOT NULL,
+    size      INTEGER NOT NULL,
+    created   REAL NOT NULL,
+    last_used REAL NOT NULL,
+    hits      INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used);
+CREATE TABLE IF NOT EXISTS stats (
+    name  TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Line endings and trailing whitespace do not change the question."""
+    lines = prompt.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+
+def cache_key(prompt: str, params: Optional[Dict] = None) -> str:
+    h = hashlib.sha256()
+    h.update(json.dumps(params or {}, sort_keys=True, default=str).encode("utf-8"))
+    h.update(b"\0")
+    h.update(normalize_prompt(prompt).encode("utf-8"))
+    return h.hexdigest()
+
+
+class ResponseCache:
+    """
+    SQLite-backed prompt -> response store. Safe to share between the
+    threads asyncio.to_thread runs LLM calls on.
+
+    Lookups only read the database: hit counters and last_used times are
+    kept in memory and written out with the next put(), or by flush(),
+    stats() and close().
+    """
+
+    def __init__(self, path: str = "llm_cache.sqlite", max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+        # Not yet written: key -> (last_used, extra hits), stat name -> delta
+        self._touched: Dict[str, tuple] = {}
+        self._stat_deltas: Counter = Counter()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT response FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                self._stat_deltas["misses"] += 1
+                return None
+            self.hits += 1
+            self._stat_deltas["hits"] += 1
+            _, hits = self._touched.get(key, (0, 0))
+            self._touched[key] = (time.time(), hits + 1)
+            return row[0]
+
+    def put(self, key: str, response: str):
+        size = len(response.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._write_pending()
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, response, size, now, now),
+            )
+            self._evict()
+            self._db.commit()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._touched.pop(key, None)
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._db.commit()
+
+    def flush(self):
+        """Write buffered hit counters and last_used times."""
+        with self._lock:
+            if self._touched or self._stat_deltas:
+                self._write_pending()
+                self._db.commit()
+
+    def _write_pending(self):
+        self._db.executemany(
+            "UPDATE responses SET last_used = ?, hits = hits + ? WHERE key = ?",
+            [(used, hits, key) for key, (used, hits) in self._touched.items()],
+        )
+        self._db.executemany(
+            "INSERT INTO stats (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            list(self._stat_deltas.items()),
+        )
+        self._touched.clear()
+        self._stat_deltas.clear()
+
+    def _evict(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self._db.execute(
+            "SELECT key, size FROM responses ORDER BY last_used"
+        )
+        doomed = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            total -= size
+        self._db.executemany("DELETE FROM responses WHERE key = ?", doomed)
+
+    def stats(self) -> Dict:
+        """Session hit rate plus lifetime counters and current size."""
+        self.flush()
+        with self._lock:
+            entries, size = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+            lifetime = dict(self._db.execute("SELECT name, value FROM stats"))
+        lookups = self.hits + self.misses
+        total = lifetime.get("hits", 0) + lifetime.get("misses", 0)
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "lifetime_hits": lifetime.get("hits", 0),
+            "lifetime_misses": lifetime.get("misses", 0),
+            "lifetime_hit_rate": lifetime.get("hits", 0) / total if total else 0.0,
+            "entries": entries,
+            "bytes": size,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._db.execute("DELETE FROM stats")
+            self._db.commit()
+            self._touched.clear()
+            self._stat_deltas.clear()
+            self.hits = self.misses = 0
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def cached_llm(
+    llm: Callable,
+    cache: ResponseCache,
+    params: Optional[Dict] = None,
+    validate: Optional[Callable[[str], bool]] = None,
+) -> Callable:
+    """
+    Wrap llm (plain or coroutine function, prompt -> text) with cache.
+    params are the model parameters that are part of the key.
+
+    Fresh responses passing validate are held until the caller calls
+    wrapper.settle(prompt, accepted): accepted ones are stored, rejected
+    ones dropped, and a rejected cached response is evicted. Anything
+    not accepted goes back to the LLM on the next ask.
+    """
+    held: Dict[str, str] = {}
+    held_lock = threading.Lock()
+
+    def hold(key, response):
+        if response is not None and (validate is None or validate(response)):
+            with held_lock:
+                held[key] = response
+
+    def settle(prompt, accepted: bool):
+        key = cache_key(prompt, params)
+        with held_lock:
+            response = held.pop(key, None)
+        if not accepted:
+            cache.delete(key)
+        elif response is not None:
+            cache.put(key, response)
+
+    if inspect.iscoroutinefunction(llm):
+        @functools.wraps(llm)
+        async def async_wrapper(prompt):
+            key = cache_key(prompt, params)
+            hit = cache.get(key)
+            if hit is not None:
+                return hit
+            response = await llm(prompt)
+            hold(key, response)
+            return response
+        async_wrapper.settle = settle
+        return async_wrapper
+
+    @functools.wraps(llm)
+    def wrapper(prompt):
+        key = cache_key(prompt, params)
+        hit = cache.get(key)
+        if hit is not None:
+            return hit
+        response = llm(prompt)
+        hold(key, response)
+        return response
+    wrapper.settle = settle
+    return wrapper
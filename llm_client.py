@@ -0,0 +1,317 @@
+"""
+Pooled, rate-limited client for OpenAI-compatible chat completions.
+
+Stdlib only: http.client connections are kept in a small pool and
+reused across calls; a token bucket per minute limits requests (rpm)
+and estimated tokens (tpm); 429 / 5xx / connection errors are retried
+with jittered exponential backoff, honouring Retry-After. complete()
+is the sync interface, acomplete() the asyncio one (bounded by a
+semaphore, HTTP runs on a thread pool).
+
+get_llm_response(prompt) is the default llm for new.refine_xslt,
+configured from the environment:
+
+    OPENAI_API_KEY, OPENAI_BASE_URL (default https://api.openai.com/v1),
+    MVCTR_LLM_MODEL, MVCTR_LLM_RPM, MVCTR_LLM_TPM
+"""
+import asyncio
+import http.client
+import json
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+from batcher import estimate_tokens
+
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+DEFAULT_MODEL = "gpt-4o"
+DEFAULT_RPM = 60
+DEFAULT_TPM = 90_000
+# Completion tokens reserved per call when max_tokens is not set
+DEFAULT_COMPLETION_TOKENS = 1024
+
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMError(RuntimeError):
+    pass
+
+
+class RetryableError(LLMError):
+    def __init__(self, message, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+# ============================================================
+# Rate limiting
+# ============================================================
+
+class TokenBucket:
+    """
+    Continuous-refill bucket of `capacity` units per minute. reserve()
+    takes units immediately (the balance may go negative) and returns
+    how long the caller must wait before using them, so sync callers
+    can time.sleep and async callers asyncio.sleep on the same bucket.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        amount = min(float(amount), self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+            self.updated = now
+            self.level -= amount
+            return 0.0 if self.level >= 0 else -self.level / self.rate
+
+
+class RateLimiter:
+    def __init__(self, rpm: Optional[float], tpm: Optional[float]):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+
+    def reserve(self, tokens: int) -> float:
+        wait = 0.0
+        if self.requests is not None:
+            wait = max(wait, self.requests.reserve(1))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.reserve(tokens))
+        return wait
+
+
+# ============================================================
+# Connection pool
+# ============================================================
+
+class ConnectionPool:
+    """LIFO pool of keep-alive connections to one host."""
+
+    def __init__(self, base_url: str, size: int = 8):
+        parts = urlsplit(base_url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.path = parts.path.rstrip("/")
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def _connect(self, timeout):
+        cls = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+        return cls(self.host, self.port, timeout=timeout)
+
+    def get(self, timeout: float):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect(timeout)
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn
+
+    def put(self, conn):
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+# ============================================================
+# Client
+# ============================================================
+
+def backoff_delay(attempt: int, base: float, cap: float, retry_after: Optional[float] = None) -> float:
+    """Full-jitter exponential backoff; Retry-After wins when given."""
+    if retry_after is not None:
+        return retry_after + random.uniform(0, base)
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def strip_fences(text: str) -> str:
+    """Drop a ```xml ... ``` fence around a reply, if present."""
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        if text.rstrip().endswith("```"):
+            text = text.rstrip()[:-3]
+    return text.strip()
+
+
+class LLMClient:
+    def __init__(
+        self,
+        base_url: str = DEFAULT_BASE_URL,
+        api_key: Optional[str] = None,
+        model: str = DEFAULT_MODEL,
+        rpm: Optional[float] = DEFAULT_RPM,
+        tpm: Optional[float] = DEFAULT_TPM,
+        temperature: float = 0.0,
+        max_tokens: Optional[int] = None,
+        timeout: float = 60.0,
+        max_retries: int = 5,
+        pool_size: int = 8,
+        concurrency: int = 8,
+        backoff_base: float = 1.0,
+        backoff_cap: float = 30.0,
+    ):
+        self.api_key = api_key
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.limiter = RateLimiter(rpm, tpm)
+        self.pool = ConnectionPool(base_url, pool_size)
+        self.concurrency = concurrency
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+        self._semaphores: Dict[asyncio.AbstractEventLoop, asyncio.Semaphore] = {}
+
+    @property
+    def params(self) -> Dict:
+        """Model parameters that change the answer (llm_cache key)."""
+        return {"model": self.model, "temperature": self.temperature, "max_tokens": self.max_tokens}
+
+    def _body(self, prompt: str) -> bytes:
+        body = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": self.temperature,
+        }
+        if self.max_tokens is not None:
+            body["max_tokens"] = self.max_tokens
+        return json.dumps(body).encode("utf-8")
+
+    def _headers(self) -> Dict[str, str]:
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+    def _cost(self, prompt: str) -> int:
+        return estimate_tokens(prompt) + (self.max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+    def _post(self, body: bytes, timeout: float) -> str:
+        """One HTTP attempt on a pooled connection."""
+        conn = self.pool.get(timeout)
+        try:
+            conn.request("POST", f"{self.pool.path}/chat/completions", body, self._headers())
+            resp = conn.getresponse()
+            data = resp.read()
+        except (OSError, http.client.HTTPException) as e:
+            conn.close()
+            raise RetryableError(f"{type(e).__name__}: {e}") from None
+
+        if resp.will_close:
+            conn.close()
+        else:
+            self.pool.put(conn)
+
+        if resp.status in RETRY_STATUSES:
+            retry_after = resp.getheader("Retry-After")
+            try:
+                retry_after = float(retry_after) if retry_after else None
+            except ValueError:
+                retry_after = None
+            raise RetryableError(f"HTTP {resp.status}", retry_after)
+        if resp.status != 200:
+            raise LLMError(f"HTTP {resp.status}: {data[:200]!r}")
+
+        try:
+            return json.loads(data)["choices"][0]["message"]["content"]
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            raise LLMError(f"Malformed completion: {e}") from None
+
+    def complete(self, prompt: str, timeout: Optional[float] = None) -> str:
+        body, cost = self._body(prompt), self._cost(prompt)
+        timeout = timeout or self.timeout
+        for attempt in range(self.max_retries + 1):
+            time.sleep(self.limiter.reserve(cost))
+            try:
+                return self._post(body, timeout)
+            except RetryableError as e:
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(backoff_delay(attempt, self.backoff_base, self.backoff_cap, e.retry_after))
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        sem = self._semaphores.get(loop)
+        if sem is None:
+            sem = self._semaphores[loop] = asyncio.Semaphore(self.concurrency)
+        return sem
+
+    async def acomplete(self, prompt: str, timeout: Optional[float] = None) -> str:
+        body, cost = self._body(prompt), self._cost(prompt)
+        timeout = timeout or self.timeout
+        loop = asyncio.get_running_loop()
+        async with self._semaphore():
+            for attempt in range(self.max_retries + 1):
+                await asyncio.sleep(self.limiter.reserve(cost))
+                try:
+                    return await loop.run_in_executor(self._executor, self._post, body, timeout)
+                except RetryableError as e:
+                    if attempt == self.max_retries:
+                        raise
+                    await asyncio.sleep(
+                        backoff_delay(attempt, self.backoff_base, self.backoff_cap, e.retry_after)
+                    )
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ============================================================
+# Default client for new.refine_xslt
+# ============================================================
+
+_default_client: Optional[LLMClient] = None
+_default_lock = threading.Lock()
+
+
+def default_client() -> LLMClient:
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            _default_client = LLMClient(
+                base_url=os.environ.get("OPENAI_BASE_URL", DEFAULT_BASE_URL),
+                api_key=os.environ.get("OPENAI_API_KEY"),
+                model=os.environ.get("MVCTR_LLM_MODEL", DEFAULT_MODEL),
+                rpm=float(os.environ.get("MVCTR_LLM_RPM", DEFAULT_RPM)),
+                tpm=float(os.environ.get("MVCTR_LLM_TPM", DEFAULT_TPM)),
+            )
+        return _default_client
+
+
+def get_llm_response(prompt: str) -> str:
+    return strip_fences(default_client().complete(prompt))
+
+
+async def get_llm_response_async(prompt: str) -> str:
+    return strip_fences(await default_client().acomplete(prompt))
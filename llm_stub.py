@@ -0,0 +1,165 @@
+"""
+Local stand-in for an OpenAI-compatible chat completions endpoint.
+
+Replays canned responses (a JSON list, cycled) or, without one, echoes
+the prompt's editable ```xml block back unchanged, after a configurable
+latency. fail_rate answers that share of requests with 429 and a
+Retry-After header, to exercise client backoff.
+
+    python llm_stub.py --port 8765 --latency 0.2 [--responses canned.json]
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 python new.py
+"""
+import argparse
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+
+def echo_block(prompt: str) -> str:
+    if "```xml\n" not in prompt:
+        return prompt
+    return prompt.split("```xml\n", 1)[1].split("```", 1)[0]
+
+
+class StubLLMServer:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        responses: Optional[List[str]] = None,
+        fail_rate: float = 0.0,
+        retry_after: float = 0.1,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.retry_after = retry_after
+        self.requests = 0
+        self._responses = itertools.cycle(responses) if responses else None
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def reply(self, prompt: str) -> str:
+        with self._lock:
+            if self._responses is not None:
+                return next(self._responses)
+        return echo_block(prompt)
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, so client pooling is exercised
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, payload, headers=()):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in headers:
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if not self.path.endswith("/chat/completions"):
+                    self._send(404, {"error": {"message": "not found"}})
+                    return
+                with server._lock:
+                    server.requests += 1
+                if server.fail_rate and random.random() < server.fail_rate:
+                    self._send(429, {"error": {"message": "rate limited"}},
+                               [("Retry-After", str(server.retry_after))])
+                    return
+
+                try:
+                    request = json.loads(body)
+                    prompt = request["messages"][-1]["content"]
+                except (ValueError, KeyError, IndexError):
+                    self._send(400, {"error": {"message": "bad request"}})
+                    return
+
+                delay = server.latency + random.uniform(0, server.jitter)
+                if delay:
+                    time.sleep(delay)
+
+                content = server.reply(prompt)
+                self._send(200, {
+                    "object": "chat.completion",
+                    "model": request.get("model", "stub"),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": {
+                        "prompt_tokens": len(prompt) // 4,
+                        "completion_tokens": len(content) // 4,
+                    },
+                })
+
+        return Handler
+
+    def start(self) -> "StubLLMServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--responses", help="JSON list of canned replies, cycled")
+    args = parser.parse_args()
+
+    responses = None
+    if args.responses:
+        with open(args.responses, encoding="utf-8") as f:
+            responses = json.load(f)
+
+    server = StubLLMServer(
+        args.host, args.port, args.latency, args.jitter, responses, args.fail_rate
+    )
+    print(f"stub LLM listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 
 
-from slicer import extract_xslt_slice
+from slicer import build_slice_prompt, extract_xslt_slice_with_context
 from merge_fix import replace_xslt_slice
 
 
@@ -72,9 +72,10 @@ def main():
     "expected_source_xpath": "/Order/Customer/TaxNumber"
     }
     
-    xslt_slice = extract_xslt_slice(xslt_string, diff)
-    print(len(xslt_slice))
-    print(xslt_slice)
+    xslt_slice, dependencies = extract_xslt_slice_with_context(xslt_string, diff)
+    prompt = build_slice_prompt(diff, xslt_slice, dependencies)
+    print(len(prompt))
+    print(prompt)
 
     # Step 2: Send to LLM → get fixed_slice_xml
     fixed_slice_xml = """<Buyer>
@@ -7,6 +7,8 @@ from safety_check import (
     assert_no_forbidden_xsl,
     assert_single_root,
     assert_output_xpath_exists,
+    missing_output_xpaths,
+    xslt_compiles,
 )
 
 def find_anchor_node(xslt_root, output_xpath):
@@ -51,37 +53,47 @@ def ensure_xsl_namespace(xml_fragment: str) -> str:
 
 from lxml import etree
 
-from lxml import etree
+from instrument import span
+from output_index import OutputIndex
 
-def replace_xslt_slice(
-    xslt_string: str,
-    output_xpath: str,
-    fixed_slice_xml: str
-) -> str:
+
+def parse_fixed_slice(fixed_slice_xml: str) -> etree._Element:
     """
-    Replace the responsibility slice in the original XSLT with the fixed slice.
+    Inject the xsl namespace if needed and parse the fragment once,
+    raising ValueError (as assert_single_root does) if it is invalid.
     """
-
-    # 1. Parse original XSLT ONCE
-    xslt_root = etree.XML(xslt_string.encode())
-    
-
-    # 1. Inject namespace FIRST
     fixed_slice_xml = ensure_xsl_namespace(fixed_slice_xml)
+    try:
+        return etree.XML(fixed_slice_xml.encode())
+    except etree.XMLSyntaxError as e:
+        raise ValueError(f"Invalid XML fragment: {e}")
+
 
-    # 2. Now it is safe to parse / validate
-    assert_single_root(fixed_slice_xml)
-    fixed_elem = etree.XML(fixed_slice_xml.encode())
+def merge_fixed_slice(
+    xslt_root: etree._Element,
+    output_xpath: str,
+    fixed_slice,
+    index: OutputIndex = None,
+) -> etree._Element:
+    """
+    Replace the responsibility slice in a live XSLT tree with the fixed
+    slice (text or element) and validate the same tree object. Nothing
+    is serialized; on a failed check the tree is left unchanged.
+    An OutputIndex over the tree is used for lookup and kept in sync.
+    """
+    if isinstance(fixed_slice, str):
+        fixed_elem = parse_fixed_slice(fixed_slice)
+    else:
+        fixed_elem = fixed_slice
 
-    
     # -------------------------
     # Locate anchor
     # -------------------------
-    anchor_node, _ = find_nearest_existing_output_node(xslt_root, output_xpath)
+    anchor_node, _ = find_nearest_existing_output_node(xslt_root, output_xpath, index)
     if anchor_node is None:
         raise ValueError("Anchor node not found")
-    
-        # -------------------------
+
+    # -------------------------
     # Structural safety checks
     # -------------------------
     assert_same_root_tag(anchor_node, fixed_elem)
@@ -91,21 +103,129 @@ def replace_xslt_slice(
     if parent is None:
         raise ValueError("Anchor node has no parent; cannot replace")
 
-    # 4. Preserve formatting
+    # Preserve formatting
     fixed_elem.tail = anchor_node.tail
 
-    # 5. Replace node
-    parent.replace(anchor_node, fixed_elem)
+    with span("merge"):
+        parent.replace(anchor_node, fixed_elem)
+        if index is not None:
+            index.replace(anchor_node, fixed_elem)
+
+    # -------------------------
+    # Post-merge validation
+    # -------------------------
+    try:
+        with span("validate"):
+            assert_output_xpath_exists(xslt_root, output_xpath)
+    except ValueError:
+        parent.replace(fixed_elem, anchor_node)
+        if index is not None:
+            index.replace(fixed_elem, anchor_node)
+        raise
+
+    return xslt_root
+
+
+def replace_xslt_slice(
+    xslt_string: str,
+    output_xpath: str,
+    fixed_slice_xml: str
+) -> str:
+    """
+    Replace the responsibility slice in the original XSLT with the fixed slice.
+    Text-in/text-out wrapper around merge_fixed_slice.
+    """
+    xslt_root = etree.XML(xslt_string.encode())
+    merge_fixed_slice(xslt_root, output_xpath, fixed_slice_xml)
 
-    updated_xslt = etree.tostring(
+    return etree.tostring(
         xslt_root,
         pretty_print=True,
         encoding="unicode"
     )
 
-    # -------------------------
-    # Post-merge validation
-    # -------------------------
-    assert_output_xpath_exists(updated_xslt, output_xpath)
 
-    return updated_xslt
+def replace_xslt_slices(xslt, fixes):
+    """
+    Apply many (output_xpath, fixed_slice_xml) fixes against one parse.
+
+    All anchors are located and checked up front. A fix whose anchor is
+    the same as, or nested with, an earlier fix's anchor is skipped as
+    overlapping. The rest are applied in a single pass and the output
+    XPath check runs once on the result; fixes failing it are reverted.
+    If the merged stylesheet then fails to compile, every fix is reverted
+    and the tree is left as it was.
+
+    xslt may be text or a live tree; returns (result, skipped) where
+    result has the same form and skipped lists (output_xpath, reason).
+    """
+    as_text = isinstance(xslt, str)
+    xslt_root = etree.XML(xslt.encode()) if as_text else xslt
+    index = OutputIndex(xslt_root)
+
+    planned, skipped = [], []
+    claimed = {}  # anchor node -> output_xpath that claimed it
+
+    for output_xpath, fixed_slice in fixes:
+        try:
+            fixed_elem = (
+                parse_fixed_slice(fixed_slice)
+                if isinstance(fixed_slice, str) else fixed_slice
+            )
+            anchor_node, _ = find_nearest_existing_output_node(
+                xslt_root, output_xpath, index
+            )
+            if anchor_node is None:
+                raise ValueError("Anchor node not found")
+            if anchor_node.getparent() is None:
+                raise ValueError("Anchor node has no parent; cannot replace")
+            assert_same_root_tag(anchor_node, fixed_elem)
+            assert_no_forbidden_xsl(fixed_elem)
+        except ValueError as e:
+            skipped.append((output_xpath, str(e)))
+            continue
+
+        related = [anchor_node, *anchor_node.iterancestors()]
+        owner = next((claimed[n] for n in related if n in claimed), None)
+        if owner is None:
+            owner = next(
+                (xp for n, xp in claimed.items()
+                 if any(a is anchor_node for a in n.iterancestors())),
+                None,
+            )
+        if owner is not None:
+            skipped.append((output_xpath, f"Anchor overlaps fix for {owner}"))
+            continue
+
+        claimed[anchor_node] = output_xpath
+        planned.append((output_xpath, anchor_node, fixed_elem))
+
+    with span("merge", fixes=len(planned)):
+        for _, anchor_node, fixed_elem in planned:
+            fixed_elem.tail = anchor_node.tail
+            anchor_node.getparent().replace(anchor_node, fixed_elem)
+
+    with span("validate", fixes=len(planned)):
+        missing = set(missing_output_xpaths(xslt_root, [p[0] for p in planned]))
+    for output_xpath, anchor_node, fixed_elem in planned:
+        if output_xpath in missing:
+            fixed_elem.getparent().replace(fixed_elem, anchor_node)
+            skipped.append((
+                output_xpath,
+                f"Post-merge validation failed: output XPath not found: {output_xpath}",
+            ))
+    applied = [p for p in planned if p[0] not in missing]
+
+    with span("validate", fixes=len(applied)):
+        compiles = not applied or xslt_compiles(xslt_root)
+    if not compiles:
+        for output_xpath, anchor_node, fixed_elem in applied:
+            fixed_elem.getparent().replace(fixed_elem, anchor_node)
+            skipped.append((
+                output_xpath,
+                "Post-merge validation failed: merged stylesheet does not compile",
+            ))
+
+    if as_text:
+        return etree.tostring(xslt_root, pretty_print=True, encoding="unicode"), skipped
+    return xslt_root, skipped
@@ -1,18 +1,34 @@
 from lxml import etree
 
+from instrument import span
+from xslt_slicer import SliceSpan
+
+
 def merge_slice(original_xslt, line_range, new_fragment):
-    lines = original_xslt.splitlines()
-    start, end = line_range
+    """
+    Splice new_fragment into original_xslt. line_range is either a
+    SliceSpan from xslt_slicer.extract_slice (exact text offsets) or a
+    legacy (start_line, end_line) pair of 0-based line indexes.
+    """
+    if isinstance(line_range, SliceSpan):
+        merged_str = (
+            original_xslt[:line_range.start]
+            + new_fragment
+            + original_xslt[line_range.end:]
+        )
+    else:
+        lines = original_xslt.splitlines()
+        start, end = line_range
 
-    merged = (
-        lines[:start]
-        + new_fragment.splitlines()
-        + lines[end:]
-    )
+        merged = (
+            lines[:start]
+            + new_fragment.splitlines()
+            + lines[end:]
+        )
 
-    merged_str = "\n".join(merged)
+        merged_str = "\n".join(merged)
 
-    etree.XML(merged_str.encode())
-    etree.XSLT(etree.XML(merged_str.encode()))
+    with span("validate"):
+        etree.XSLT(etree.XML(merged_str.encode()))
 
     return merged_str
@@ -1,10 +1,28 @@
+import asyncio
+import inspect
+import logging
 from lxml import etree
-from copy import deepcopy
-from typing import List, Dict
+from typing import Dict, List, Optional
+
+from checkpoint import RunCheckpoint, diff_fingerprint, load_checkpoint, save_checkpoint
+from defuse import DefUseIndex
+from diff_loader import iter_diff_records
+from instrument import profile_run, span, timed
+from llm_cache import ResponseCache, cached_llm
+from llm_client import default_client, get_llm_response
+from output_index import OutputIndex, output_name
+from patching import PatchLog
+from pruning import ancestor_skeleton, prune_snippet
+from safety_check import xslt_compiles
+from slicer import dependency_context
+from xml_diff import count_diffs, rediff_subtree, unindexed
+from xslt_runner import parse_input
 
 XSL_NS = "http://www.w3.org/1999/XSL/Transform"
 XSL = f"{{{XSL_NS}}}"
 
+log = logging.getLogger(__name__)
+
 
 # ============================================================
 # Diff handling
@@ -85,18 +103,20 @@ def score_match(node, anchor_parts):
     return score
 
 
-def locate_best_node(root, anchor_xpath: str):
+@timed("locate")
+def locate_best_node(root, anchor_xpath: str, index: OutputIndex = None):
     parts = [p for p in anchor_xpath.split("/") if p]
     if not parts:
         return None
 
+    index = index or OutputIndex(root)
     leaf = parts[-1]
-    candidates = find_literal_nodes(root, leaf)
+    candidates = index.candidates(leaf)
 
     if not candidates:
         return None
 
-    scored = [(score_match(c, parts[:-1]), c) for c in candidates]
+    scored = [(index.score(c, parts[:-1]), c) for c in candidates]
     scored.sort(key=lambda x: x[0], reverse=True)
 
     best_score, best_node = scored[0]
@@ -133,10 +153,11 @@ def extract_snippet(loop_node) -> str:
     return etree.tostring(loop_node, pretty_print=True, encoding="unicode")
 
 
-def extract_context(loop_node) -> str:
+def extract_context(loop_node, defuse: DefUseIndex = None) -> str:
     """
     Minimal read-only context:
-    parent xsl:for-each nodes only.
+    parent xsl:for-each nodes, plus (with a DefUseIndex) the variable
+    and param definitions the loop depends on.
     """
     ctx = []
     cur = loop_node.getparent()
@@ -144,14 +165,22 @@ def extract_context(loop_node) -> str:
         if cur.tag == XSL + "for-each":
             ctx.append(etree.tostring(cur, pretty_print=True, encoding="unicode"))
         cur = cur.getparent()
-    return "\n".join(ctx)
+    if defuse is not None:
+        ctx.append(dependency_context(loop_node, defuse))
+    return "\n".join(c for c in ctx if c)
 
 
 # ============================================================
 # Prompt
 # ============================================================
 
-def build_prompt(anchor, diffs, snippet, context) -> str:
+PLACEHOLDER_RULE = """
+* <keep:block id="..."/> elements stand for unchanged XSLT: keep every one,
+  with its id, exactly where it is; never edit, move or drop them"""
+
+
+def build_prompt(anchor, diffs, snippet, context, placeholders=False) -> str:
+    rules = PLACEHOLDER_RULE if placeholders else ""
     return f"""
 You are fixing ONE XSLT BLOCK.
 
@@ -176,24 +205,12 @@ RULES:
 * Fix ONLY the listed diffs
 * COUNT_MISMATCH → fix loop structure
 * EXTRA → add guards or remove emission
-* MISSING → add missing output in correct loop
+* MISSING → add missing output in correct loop{rules}
 
 Return ONLY valid XSLT XML. No explanation.
 """
 
 
-# ============================================================
-# Validation
-# ============================================================
-
-def xslt_compiles(xslt_root) -> bool:
-    try:
-        etree.XSLT(xslt_root)
-        return True
-    except Exception:
-        return False
-
-
 # ============================================================
 # DOM patching
 # ============================================================
@@ -210,123 +227,509 @@ def anchor_has_extra(diffs):
 
 
 # ============================================================
-# Main refinement function
+# Repair steps (shared by sync and async modes)
 # ============================================================
 
-def refine_xslt(xslt_str: str, spec_validated_diff: List[Dict]) -> str:
-    xslt_root = parse_xslt(xslt_str)
-    snapshot = deepcopy(xslt_root)
+LLM_ATTEMPTS = 2
+DEFAULT_CONCURRENCY = 8
+
+
+def resolve_loop_owner(xslt_root, anchor, index: OutputIndex = None):
+    literal_node = locate_best_node(xslt_root, anchor, index)
+    if literal_node is None:
+        return None
+    return find_loop_owner(literal_node)
+
+
+def patch_output_prefix(loop_node) -> str:
+    """
+    Output path a patch to loop_node can affect: the literal output
+    elements enclosing it in the match="/" template. A loop in any other
+    template may be instantiated anywhere, so it gets "/" (whole output).
+    """
+    names = []
+    for a in loop_node.iterancestors():
+        if a.tag == XSL + "template":
+            if a.get("match") != "/":
+                return "/"
+            break
+        name = output_name(a)
+        if name is not None:
+            if "{" in name:
+                return "/"
+            names.append(name)
+    return "/" + "/".join(reversed(names))
+
+
+def build_anchor_prompt(anchor, diffs, loop_node, defuse: DefUseIndex = None) -> str:
+    snippet = extract_snippet(loop_node)
+    context = extract_context(loop_node, defuse)
+    return build_prompt(anchor, diffs, snippet, context)
+
+
+def parse_llm_fix(fixed_snippet):
+    try:
+        return etree.XML(fixed_snippet.encode("utf-8"))
+    except Exception:
+        return None
+
+
+def request_fix(prompt, llm):
+    for _ in range(LLM_ATTEMPTS):
+        with span("llm"):
+            fixed_snippet = llm(prompt)
+        new_loop = parse_llm_fix(fixed_snippet)
+        if new_loop is not None:
+            return new_loop
+    return None
 
-    grouped = group_diffs_by_anchor(spec_validated_diff)
-    
-    print(grouped)
 
-    ordered_anchors = sorted(
+async def request_fix_async(prompt, llm):
+    for _ in range(LLM_ATTEMPTS):
+        with span("llm"):
+            if inspect.iscoroutinefunction(llm):
+                fixed_snippet = await llm(prompt)
+            else:
+                fixed_snippet = await asyncio.to_thread(llm, prompt)
+        new_loop = parse_llm_fix(fixed_snippet)
+        if new_loop is not None:
+            return new_loop
+    return None
+
+
+def settle_response(llm, prompt, accepted: bool):
+    """
+    Report whether the fix for prompt was committed to an llm that wants
+    to know (llm_cache.cached_llm only keeps answers that were).
+    """
+    settle = getattr(llm, "settle", None)
+    if settle is not None:
+        settle(prompt, accepted)
+
+
+def commit_fix(
+    xslt_root, diffs, loop_node, new_loop, patches: PatchLog, accept=None
+) -> bool:
+    """
+    Swap new_loop in for loop_node on the live tree and keep it only if
+    the stylesheet still compiles and accept(xslt_root), when given,
+    approves it (e.g. corpus.CorpusGate). Rejected fixes are undone in
+    place.
+    """
+    # Enforce semantic change for EXTRA / MISSING
+    if (has_extra(diffs) or has_missing(diffs)) and \
+    etree.tostring(loop_node) == etree.tostring(new_loop):
+        return False
+
+    with span("merge"):
+        patches.apply(loop_node, new_loop)
+
+    with span("validate"):
+        ok = xslt_compiles(xslt_root) and (accept is None or accept(xslt_root))
+    if not ok:
+        patches.rollback()
+        return False
+
+    patches.commit()
+    return True
+
+
+def order_anchors(grouped):
+    return sorted(
         grouped.keys(),
         key=lambda a: anchor_priority(grouped[a])
     )
-    
-    print(ordered_anchors)
 
-    locked = set()
 
-    for anchor in ordered_anchors:
-        if anchor in locked:
+def plan_loop_groups(xslt_root, anchors, index: OutputIndex = None):
+    """
+    Resolve every anchor up front and group those sharing a loop owner:
+    [(anchors, loop_node)], ordered by each group's first anchor.
+    Anchors with no loop owner are dropped.
+    """
+    index = index or OutputIndex(xslt_root)
+    groups = {}
+    for anchor in anchors:
+        loop_node = resolve_loop_owner(xslt_root, anchor, index)
+        if loop_node is None:
+            log.info("No loop owner for %s", anchor)
             continue
+        groups.setdefault(loop_node, []).append(anchor)
+    return [(group, loop_node) for loop_node, group in groups.items()]
 
-        diffs = grouped[anchor]
 
-        literal_node = locate_best_node(xslt_root, anchor)
-        print(literal_node)
-        if literal_node is None:
-            continue
+def group_diffs(grouped, anchors) -> List[Dict]:
+    return [d for anchor in anchors for d in grouped[anchor]]
+
 
-        loop_node = find_loop_owner(literal_node)
-        print(loop_node)
+def build_group_prompt(anchors, diffs, loop_node, defuse: DefUseIndex = None) -> str:
+    """One prompt covering every anchor of a loop owner."""
+    return build_anchor_prompt("\n".join(anchors), diffs, loop_node, defuse)
+
+
+@timed("prompt")
+def prepare_prompt(anchors, diffs, loop_node, prune=False, defuse: DefUseIndex = None):
+    """
+    (prompt, pruned) for a loop owner. With prune, subtrees unrelated to
+    the diffs become placeholders and the context is an ancestor
+    skeleton; pruned is then needed to expand the LLM's fix.
+    """
+    if not prune:
+        return build_group_prompt(anchors, diffs, loop_node, defuse), None
+    pruned = prune_snippet(loop_node, diffs)
+    context = ancestor_skeleton(loop_node)
+    if defuse is not None:
+        context = "\n".join(filter(None, [dependency_context(loop_node, defuse), context]))
+    prompt = build_prompt(
+        "\n".join(anchors), diffs, pruned.text, context, placeholders=True,
+    )
+    return prompt, pruned
+
+
+def expand_fix(new_loop, pruned):
+    if new_loop is None or pruned is None:
+        return new_loop
+    expanded = pruned.expand(new_loop)
+    if expanded is None:
+        log.info("Rejected fix: placeholders missing or altered")
+    return expanded
+
+
+def attached(node, root) -> bool:
+    """False once node sits in a subtree that has been replaced."""
+    while node is not None and node is not root:
+        node = node.getparent()
+    return node is root
+
+
+# ============================================================
+# Incremental re-diff
+# ============================================================
+
+class DiffTracker:
+    """
+    Count diffs of the patched stylesheet's output against a target.
+    One full diff up front; after a committed fix only the output under
+    the patch's prefix is re-diffed and spliced in (rediff_subtree), so
+    groups an earlier fix already resolved are not sent to the LLM.
+    """
+
+    def __init__(self, xslt_root, input_xml: str, target_xml: str):
+        self.input_doc = parse_input(input_xml)
+        self.target = etree.XML(target_xml.encode())
+        self.diffs = count_diffs(self._output(xslt_root), self.target)
+
+    def _output(self, xslt_root):
+        with span("transform"):
+            return etree.XSLT(xslt_root)(self.input_doc)
+
+    def refresh(self, xslt_root, loop_nodes):
+        """Re-diff the output under each patched loop's prefix."""
+        output = self._output(xslt_root)
+        for prefix in dict.fromkeys(patch_output_prefix(n) for n in loop_nodes):
+            self.diffs = rediff_subtree(self.diffs, output, self.target, prefix, counts=True)
+
+    def still_open(self, diffs) -> List[Dict]:
+        """The given spec diffs whose path still differs from the target."""
+        live = {d["xpath"] for d in self.diffs}
+        return [d for d in diffs if unindexed(d.get("output_xpath") or d["xpath"]) in live]
+
+    @property
+    def done(self) -> bool:
+        return not self.diffs
+
+
+# ============================================================
+# Main refinement function
+# ============================================================
+
+def resume_state(checkpoint_path, spec_validated_diff, xslt_str, ordered_anchors):
+    """
+    (xslt_str, locked, pending) to start from: the saved checkpoint when
+    one exists, else the fresh run.
+    """
+    checkpoint = load_checkpoint(checkpoint_path, spec_validated_diff)
+    if checkpoint is None:
+        return xslt_str, set(), ordered_anchors
+    return checkpoint.xslt, set(checkpoint.locked), checkpoint.pending
+
+
+def write_checkpoint(checkpoint_path, xslt_root, locked, pending, diffs_key):
+    save_checkpoint(
+        checkpoint_path,
+        RunCheckpoint(
+            xslt=etree.tostring(xslt_root, encoding="unicode"),
+            locked=sorted(locked),
+            pending=list(pending),
+            diffs_key=diffs_key,
+        ),
+    )
+
+
+def refine_xslt(
+    xslt_str: str,
+    spec_validated_diff: List[Dict],
+    llm=None,
+    accept=None,
+    checkpoint_path: str = None,
+    resume: bool = False,
+    checkpoint_every: int = 1,
+    prune: bool = False,
+    input_xml: str = None,
+    target_xml: str = None,
+) -> str:
+    """
+    With checkpoint_path, the stylesheet, locked anchors and pending
+    queue are saved every checkpoint_every anchors; resume=True picks up
+    from that checkpoint without re-asking anchors already visited.
+    prune=True sends pruned snippets (see pruning.prune_snippet).
+
+    With input_xml and target_xml, the output is re-diffed after each
+    committed fix (only under the patched loop, see DiffTracker) and
+    anchors whose diffs are already gone are skipped.
+    """
+    llm = llm or get_llm_response
+
+    grouped = group_diffs_by_anchor(spec_validated_diff)
+    ordered_anchors = order_anchors(grouped)
+    log.debug("Anchors in priority order: %s", ordered_anchors)
+
+    locked = set()
+    if checkpoint_path and resume:
+        xslt_str, locked, ordered_anchors = resume_state(
+            checkpoint_path, spec_validated_diff, xslt_str, ordered_anchors
+        )
+    diffs_key = diff_fingerprint(spec_validated_diff) if checkpoint_path else ""
+
+    xslt_root = parse_xslt(xslt_str)
+    index = OutputIndex(xslt_root)
+    patches = PatchLog(index=index, defuse=DefUseIndex(xslt_root))
+
+    tracker = (
+        DiffTracker(xslt_root, input_xml, target_xml)
+        if input_xml is not None and target_xml is not None else None
+    )
+
+    groups = plan_loop_groups(
+        xslt_root, [a for a in ordered_anchors if a not in locked], index
+    )
+
+    for position, (anchors, loop_node) in enumerate(groups, 1):
+        diffs = group_diffs(grouped, anchors)
+        if tracker is not None:
+            diffs = tracker.still_open(diffs)
+        if not diffs:
+            log.info("Anchors %s already resolved by earlier fixes", anchors)
+            locked.update(anchors)
+        else:
+            new_loop = fix_group(
+                xslt_root, anchors, diffs, loop_node, llm, index, patches, accept, prune,
+            )
+            if new_loop is not None:
+                locked.update(anchors)
+                if tracker is not None:
+                    tracker.refresh(xslt_root, [new_loop])
+
+        if checkpoint_path and (
+            position % checkpoint_every == 0 or position == len(groups)
+        ):
+            pending = [a for group, _ in groups[position:] for a in group]
+            write_checkpoint(checkpoint_path, xslt_root, locked, pending, diffs_key)
+
+    return etree.tostring(xslt_root, pretty_print=True, encoding="unicode")
+
+
+def fix_group(
+    xslt_root, anchors, diffs, loop_node, llm, index, patches, accept=None,
+    prune=False,
+) -> Optional[etree._Element]:
+    """
+    One combined prompt and fix for every anchor sharing loop_node. A
+    loop inside a subtree an earlier fix replaced is resolved again.
+    Returns the committed loop, or None.
+    """
+    if not attached(loop_node, xslt_root):
+        loop_node = resolve_loop_owner(xslt_root, anchors[0], index)
         if loop_node is None:
-            continue
+            log.info("No loop owner for %s after earlier fixes", anchors[0])
+            return None
+    log.debug("Anchors %s: loop owner %s", anchors, loop_node)
 
-        snippet = extract_snippet(loop_node)
-        context = extract_context(loop_node)
-        
-        print(snippet)
-        print(context)
-
-        prompt = build_prompt(anchor, diffs, snippet, context)
-        
-        for _ in range(2):
-            fixed_snippet = get_llm_response(prompt)
-            try:
-                new_loop = etree.XML(fixed_snippet.encode("utf-8"))
-                break
-            except Exception:
-                new_loop = None
-
-        if new_loop is None:
-            xslt_root = deepcopy(snapshot)
-            continue
-        new_loop = None
+    prompt, pruned = prepare_prompt(anchors, diffs, loop_node, prune, patches.defuse)
+    log.debug("Prompt for %s:\n%s", anchors, prompt)
 
-        test_root = deepcopy(xslt_root)
-        test_literal = locate_best_node(test_root, anchor)
-        test_loop = find_loop_owner(test_literal)
+    new_loop = expand_fix(request_fix(prompt, llm), pruned)
 
-        replace_node(test_loop, new_loop)
+    committed = new_loop is not None and commit_fix(
+        xslt_root, diffs, loop_node, new_loop, patches, accept
+    )
+    settle_response(llm, prompt, committed)
+    return new_loop if committed else None
 
-        if not xslt_compiles(test_root):
-            xslt_root = deepcopy(snapshot)
-            continue
 
-        # If this anchor had EXTRA, ensure snippet actually changed
-        if anchor_has_extra(diffs):
-            if etree.tostring(loop_node) == etree.tostring(new_loop):
-                xslt_root = deepcopy(snapshot)
-                continue
-
-        # Commit
-        # Enforce semantic change for EXTRA / MISSING
-        if (has_extra(diffs) or has_missing(diffs)) and \
-        etree.tostring(loop_node) == etree.tostring(new_loop):
-            xslt_root = deepcopy(snapshot)
+# ============================================================
+# Concurrent refinement
+# ============================================================
+
+def overlaps(node, chosen, covered) -> bool:
+    """
+    True if node is, contains, or sits inside one of the chosen loops.
+    covered holds every chosen loop plus all of its ancestors.
+    """
+    if node in covered:
+        return True
+    return any(a in chosen for a in node.iterancestors())
+
+
+def plan_wave(xslt_root, pending, index: OutputIndex = None):
+    """
+    Split pending anchors (already in priority order) into a wave of
+    (anchors, loop_node) groups whose loop owners are pairwise disjoint
+    subtrees, and the anchors deferred to a later wave because their
+    loop overlaps one already chosen. Anchors sharing a loop owner form
+    one group; anchors with no loop owner are dropped, as in refine_xslt.
+    """
+    index = index or OutputIndex(xslt_root)
+    wave, deferred = [], []
+    chosen, covered = set(), set()
+
+    for anchors, loop_node in plan_loop_groups(xslt_root, pending, index):
+        if overlaps(loop_node, chosen, covered):
+            deferred.extend(anchors)
             continue
+        wave.append((anchors, loop_node))
+        chosen.add(loop_node)
+        covered.add(loop_node)
+        covered.update(loop_node.iterancestors())
+
+    return wave, deferred
+
+
+async def refine_xslt_async(
+    xslt_str: str,
+    spec_validated_diff: List[Dict],
+    llm=None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    accept=None,
+    checkpoint_path: str = None,
+    resume: bool = False,
+    prune: bool = False,
+    input_xml: str = None,
+    target_xml: str = None,
+) -> str:
+    """
+    Same repair as refine_xslt, but prompts for loop owners that do not
+    overlap are sent concurrently (at most `concurrency` in
+    flight). Responses are applied in anchor_priority order once the
+    whole wave has answered; overlapping anchors wait for the next wave
+    so they are prompted with the already-patched loop.
+
+    llm may be a plain function or a coroutine function. Checkpoints,
+    when enabled, are written after every wave; with input_xml and
+    target_xml the output is re-diffed after every wave, as in
+    refine_xslt.
+    """
+    llm = llm or get_llm_response
 
-        # Commit
-        replace_node(loop_node, new_loop)
-        snapshot = deepcopy(xslt_root)
-        locked.add(anchor)
+    grouped = group_diffs_by_anchor(spec_validated_diff)
+    pending = order_anchors(grouped)
 
+    locked = set()
+    if checkpoint_path and resume:
+        xslt_str, locked, pending = resume_state(
+            checkpoint_path, spec_validated_diff, xslt_str, pending
+        )
+    diffs_key = diff_fingerprint(spec_validated_diff) if checkpoint_path else ""
 
+    xslt_root = parse_xslt(xslt_str)
+    index = OutputIndex(xslt_root)
+    patches = PatchLog(index=index, defuse=DefUseIndex(xslt_root))
+    semaphore = asyncio.Semaphore(concurrency)
+    tracker = (
+        DiffTracker(xslt_root, input_xml, target_xml)
+        if input_xml is not None and target_xml is not None else None
+    )
+
+    async def ask(prompt):
+        async with semaphore:
+            return await request_fix_async(prompt, llm)
+
+    while pending:
+        wave, pending = plan_wave(xslt_root, pending, index)
+
+        open_wave = []
+        for anchors, loop_node in wave:
+            diffs = group_diffs(grouped, anchors)
+            if tracker is not None:
+                diffs = tracker.still_open(diffs)
+            if diffs:
+                open_wave.append((anchors, loop_node, diffs))
+            else:
+                log.info("Anchors %s already resolved by earlier fixes", anchors)
+                locked.update(anchors)
+
+        prepared = [
+            prepare_prompt(anchors, diffs, loop_node, prune, patches.defuse)
+            for anchors, loop_node, diffs in open_wave
+        ]
+        fixes = await asyncio.gather(*(ask(prompt) for prompt, _ in prepared))
+
+        committed = []
+        answers = zip(open_wave, prepared, fixes)
+        for (anchors, loop_node, diffs), (prompt, pruned), new_loop in answers:
+            new_loop = expand_fix(new_loop, pruned)
+            ok = new_loop is not None and commit_fix(
+                xslt_root, diffs, loop_node, new_loop, patches, accept,
+            )
+            settle_response(llm, prompt, ok)
+            if ok:
+                locked.update(anchors)
+                committed.append(new_loop)
+        if tracker is not None and committed:
+            tracker.refresh(xslt_root, committed)
+
+        if checkpoint_path:
+            write_checkpoint(checkpoint_path, xslt_root, locked, pending, diffs_key)
 
     return etree.tostring(xslt_root, pretty_print=True, encoding="unicode")
 
 
+def refine_xslt_parallel(
+    xslt_str: str,
+    spec_validated_diff: List[Dict],
+    llm=None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    accept=None,
+    checkpoint_path: str = None,
+    resume: bool = False,
+    prune: bool = False,
+    input_xml: str = None,
+    target_xml: str = None,
+) -> str:
+    return asyncio.run(
+        refine_xslt_async(
+            xslt_str, spec_validated_diff, llm, concurrency, accept,
+            checkpoint_path, resume, prune, input_xml, target_xml,
+        )
+    )
+
+
 def parse_diff(file_path):
     """
     Reads a text file containing string-represented dictionaries 
-    and returns a list of dictionaries.
+    (or JSON lines) and returns a list of dictionaries.
     """
-    import ast
-    data_list = []
-    
+    def skip(line, e):
+        log.warning("Skipping malformed line: %s... Error: %s", line[:50], e)
+
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                # Strip whitespace and check if the line is not empty
-                line = line.strip()
-                if line:
-                    try:
-                        # Safely convert the string line into a dictionary
-                        dict_data = ast.literal_eval(line)
-                        data_list.append(dict_data)
-                    except (ValueError, SyntaxError) as e:
-                        print(f"Skipping malformed line: {line[:50]}... Error: {e}")
-                        
-        return data_list
+        return list(iter_diff_records(file_path, on_error=skip))
     
     except FileNotFoundError:
-        print(f"Error: The file '{file_path}' was not found.")
+        log.error("The file '%s' was not found.", file_path)
         return []
     
+import argparse
 import copy
 import json
 import time
@@ -338,12 +741,42 @@ from lxml import etree
 
 
 XSLT_PATH = "initial.xslt"
+LLM_CACHE_PATH = "llm_cache.sqlite"
+CHECKPOINT_PATH = "refine.checkpoint.json"
 
 
 def read_file(path: str) -> str:
     return Path(path).read_text(encoding="utf-8")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refine initial.xslt against spec_diffs.txt")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH,
+                        help="checkpoint file written after every anchor")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue from the checkpoint instead of starting over")
+    parser.add_argument("--prune", action="store_true",
+                        help="send pruned snippets with placeholders to the LLM")
+    parser.add_argument("--input", help="input XML; with --target, re-diff after each fix")
+    parser.add_argument("--target", help="target XML for --input")
+    parser.add_argument("--log-level", default="WARNING",
+                        help="DEBUG shows anchors, loop owners and prompts")
+    parser.add_argument("--report", help="write per-stage timings as JSON")
+    parser.add_argument("--profile", help="write a cProfile dump of the run")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level.upper(), format="%(levelname)s %(name)s: %(message)s")
+
     xslt_str = read_file(XSLT_PATH)
     spec_diffs = parse_diff('spec_diffs.txt')
-    fixed_xslt = refine_xslt(xslt_str, spec_diffs)
+    with ResponseCache(LLM_CACHE_PATH) as cache, profile_run(args.report, args.profile):
+        llm = cached_llm(
+            get_llm_response, cache, params=default_client().params,
+            validate=lambda r: parse_llm_fix(r) is not None,
+        )
+        fixed_xslt = refine_xslt(
+            xslt_str, spec_diffs, llm=llm,
+            checkpoint_path=args.checkpoint, resume=args.resume,
+            prune=args.prune,
+            input_xml=read_file(args.input) if args.input else None,
+            target_xml=read_file(args.target) if args.target else None,
+        )
+        log.info("LLM cache: %s", cache.stats())
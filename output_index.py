@@ -0,0 +1,111 @@
+from typing import Dict, List, Optional, Tuple
+
+from lxml import etree
+
+XSL_NS = "http://www.w3.org/1999/XSL/Transform"
+XSL_ELEMENT = f"{{{XSL_NS}}}element"
+
+
+def output_name(elem) -> Optional[str]:
+    """
+    Local name of the output element a stylesheet node produces:
+    literal result elements and xsl:element/@name. None otherwise.
+    """
+    if not isinstance(elem.tag, str):
+        return None
+    if not elem.tag.startswith(f"{{{XSL_NS}}}"):
+        return etree.QName(elem).localname
+    if elem.tag == XSL_ELEMENT:
+        name = elem.get("name")
+        if name:
+            return name.split(":")[-1]
+    return None
+
+
+def chain_name(elem) -> str:
+    """Name an ancestor contributes to a chain (output name if any)."""
+    return output_name(elem) or etree.QName(elem).localname
+
+
+def normalize_step(step: str) -> str:
+    """'ns0:Item[3]' -> 'Item'"""
+    return step.split("[")[0].split(":")[-1]
+
+
+def doc_order_key(node):
+    route = []
+    parent = node.getparent()
+    while parent is not None:
+        route.append(parent.index(node))
+        node, parent = parent, parent.getparent()
+    return route[::-1]
+
+
+class OutputIndex:
+    """
+    Single-pass index of output-producing stylesheet nodes.
+
+    Maps each output local name to its producing nodes (document order)
+    and keeps every indexed node's ancestor-name chain, nearest first.
+    replace() keeps it in sync when a slice is swapped in the tree.
+    """
+
+    def __init__(self, xslt_root: etree._Element):
+        self.root = xslt_root
+        self._by_name: Dict[str, List[etree._Element]] = {}
+        self._chains: Dict[etree._Element, Tuple[str, ...]] = {}
+        self._unsorted = set()
+        self._add_subtree(xslt_root, [])
+
+    def _add_subtree(self, top, ancestor_names: List[str]):
+        # ancestor_names is root-first; chains are stored nearest-first
+        stack = list(ancestor_names)
+        for event, elem in etree.iterwalk(top, events=("start", "end")):
+            if not isinstance(elem.tag, str):
+                continue
+            if event == "end":
+                stack.pop()
+                continue
+            name = output_name(elem)
+            if name is not None:
+                self._by_name.setdefault(name, []).append(elem)
+                self._chains[elem] = tuple(reversed(stack))
+                if top is not self.root:
+                    self._unsorted.add(name)
+            stack.append(chain_name(elem))
+
+    def _remove_subtree(self, top):
+        for elem in top.iter():
+            if self._chains.pop(elem, None) is None:
+                continue
+            nodes = self._by_name[output_name(elem)]
+            nodes.remove(elem)
+
+    def replace(self, old_node, new_node):
+        """Re-index after new_node has taken old_node's place in the tree."""
+        self._remove_subtree(old_node)
+        ancestors = [chain_name(a) for a in new_node.iterancestors()]
+        self._add_subtree(new_node, ancestors[::-1])
+
+    def candidates(self, name: str) -> List[etree._Element]:
+        name = normalize_step(name)
+        nodes = self._by_name.get(name, [])
+        if name in self._unsorted:
+            nodes.sort(key=doc_order_key)
+            self._unsorted.discard(name)
+        return nodes
+
+    def chain(self, node) -> Tuple[str, ...]:
+        return self._chains[node]
+
+    def score(self, node, anchor_parts: List[str]) -> int:
+        """
+        Number of trailing anchor_parts matched by node's nearest
+        ancestors, stopping at the first mismatch.
+        """
+        score = 0
+        for expected, actual in zip(reversed(anchor_parts), self._chains[node]):
+            if normalize_step(expected) != actual:
+                break
+            score += 1
+        return score
@@ -0,0 +1,61 @@
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from lxml import etree
+
+from defuse import DefUseIndex
+from output_index import OutputIndex
+
+
+@dataclass
+class SlicePatch:
+    """One in-place subtree replacement, enough to undo it."""
+    parent: etree._Element
+    old_node: etree._Element
+    new_node: etree._Element
+
+
+@dataclass
+class PatchLog:
+    """
+    Transactional patch layer over a live XSLT tree.
+
+    Instead of snapshotting the whole tree, each replacement records only
+    the detached old subtree and where it lived; undo swaps it back in
+    O(1) regardless of stylesheet size. An attached OutputIndex and
+    DefUseIndex are kept in sync on apply and undo. commit() drops the
+    records, so replaced subtrees are freed once a fix is accepted.
+    """
+    pending: List[SlicePatch] = field(default_factory=list)
+    index: Optional[OutputIndex] = None
+    defuse: Optional[DefUseIndex] = None
+
+    def apply(self, old_node, new_node) -> SlicePatch:
+        parent = old_node.getparent()
+        if parent is None:
+            raise ValueError("Cannot replace root node")
+
+        new_node.tail = old_node.tail
+        patch = SlicePatch(parent, old_node, new_node)
+        parent.replace(old_node, new_node)
+        if self.index is not None:
+            self.index.replace(old_node, new_node)
+        if self.defuse is not None:
+            self.defuse.replace(old_node, new_node)
+        self.pending.append(patch)
+        return patch
+
+    def undo(self, patch: SlicePatch):
+        patch.parent.replace(patch.new_node, patch.old_node)
+        if self.index is not None:
+            self.index.replace(patch.new_node, patch.old_node)
+        if self.defuse is not None:
+            self.defuse.replace(patch.new_node, patch.old_node)
+        self.pending.remove(patch)
+
+    def rollback(self):
+        while self.pending:
+            self.undo(self.pending[-1])
+
+    def commit(self):
+        self.pending.clear()
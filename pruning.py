@@ -0,0 +1,137 @@
+"""
+Token-minimal snippets for LLM prompts.
+
+prune_snippet copies a loop owner and swaps every child subtree that
+produces no output named in the diff paths for a placeholder element
+in PRUNE_NS. The placeholders go to the LLM in place of the XSLT they
+stand for; PrunedSnippet.expand puts the original subtrees back into
+the returned fix and rejects a fix that lost or invented a placeholder.
+ancestor_skeleton replaces full-text context with one line per
+ancestor.
+"""
+from copy import deepcopy
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+
+from lxml import etree
+
+from output_index import output_name
+from xml_diff import prefix_steps
+
+PRUNE_NS = "urn:mv-ctr:pruned"
+PRUNE_PREFIX = "keep"
+PLACEHOLDER = f"{{{PRUNE_NS}}}block"
+
+# Subtrees smaller than this are cheaper to send than to explain
+MIN_PRUNE_ELEMENTS = 3
+
+SKELETON_ATTRS = ("match", "name", "mode", "select", "test")
+
+
+def diff_names(diffs) -> Set[str]:
+    """Every local name on the diff output paths."""
+    names = set()
+    for d in diffs:
+        names.update(prefix_steps(d.get("output_xpath") or d["xpath"]))
+    return names
+
+
+def produced_names(node) -> List[str]:
+    names = []
+    for el in node.iter():
+        name = output_name(el)
+        if name is not None and name not in names:
+            names.append(name)
+    return names
+
+
+@dataclass
+class PrunedSnippet:
+    element: etree._Element
+    # placeholder id -> original subtree in the live stylesheet
+    originals: Dict[str, etree._Element] = field(default_factory=dict)
+
+    @property
+    def text(self) -> str:
+        return etree.tostring(self.element, pretty_print=True, encoding="unicode")
+
+    def expand(self, fixed: etree._Element) -> Optional[etree._Element]:
+        """
+        Replace the placeholders in fixed with copies of the subtrees they
+        stand for. None if any placeholder is missing, duplicated or
+        unknown. Copies are used so the live tree (and any undo record
+        holding it) stays intact.
+        """
+        found = list(fixed.iter(PLACEHOLDER))
+        ids = [p.get("id") for p in found]
+        if sorted(ids) != sorted(self.originals) or len(set(ids)) != len(ids):
+            return None
+        if fixed.tag == PLACEHOLDER:
+            return None
+
+        for placeholder in found:
+            original = deepcopy(self.originals[placeholder.get("id")])
+            original.tail = placeholder.tail
+            placeholder.getparent().replace(placeholder, original)
+        # Drop only the placeholder declaration: other prefixes may be
+        # used inside XPath attribute values, which cleanup cannot see
+        prefixes = {p for el in fixed.iter() for p in el.nsmap if p}
+        prefixes.discard(PRUNE_PREFIX)
+        etree.cleanup_namespaces(fixed, keep_ns_prefixes=sorted(prefixes))
+        return fixed
+
+
+def _copy_root(node):
+    nsmap = dict(node.nsmap)
+    nsmap[PRUNE_PREFIX] = PRUNE_NS
+    root = etree.Element(node.tag, nsmap=nsmap)
+    for key, value in node.attrib.items():
+        root.set(key, value)
+    root.text = node.text
+    for child in node:
+        root.append(deepcopy(child))
+    return root
+
+
+def _prune(original, copy, names, snippet, min_elements):
+    for orig_child, copy_child in zip(list(original), list(copy)):
+        if not isinstance(orig_child.tag, str):
+            continue
+        produced = produced_names(orig_child)
+        unrelated = produced and not names.intersection(produced)
+        if unrelated and sum(1 for _ in orig_child.iter()) >= min_elements:
+            key = f"k{len(snippet.originals) + 1}"
+            placeholder = copy.makeelement(PLACEHOLDER, {"id": key, "output": " ".join(produced)})
+            placeholder.tail = copy_child.tail
+            copy.replace(copy_child, placeholder)
+            snippet.originals[key] = orig_child
+            continue
+        _prune(orig_child, copy_child, names, snippet, min_elements)
+
+
+def prune_snippet(loop_node, diffs, min_elements: int = MIN_PRUNE_ELEMENTS) -> PrunedSnippet:
+    """Copy of loop_node with subtrees unrelated to diffs as placeholders."""
+    copy = _copy_root(loop_node)
+    snippet = PrunedSnippet(copy)
+    _prune(loop_node, copy, diff_names(diffs), snippet, min_elements)
+    return snippet
+
+
+def _open_tag(node) -> str:
+    qname = etree.QName(node).localname
+    if node.prefix:
+        qname = f"{node.prefix}:{qname}"
+    attrs = "".join(
+        f' {a}="{node.get(a)}"' for a in SKELETON_ATTRS if node.get(a) is not None
+    )
+    return f"<{qname}{attrs}>"
+
+
+def ancestor_skeleton(loop_node) -> str:
+    """One line per ancestor of loop_node (stylesheet root excluded)."""
+    ancestors = [a for a in loop_node.iterancestors() if a.getparent() is not None]
+    lines = [
+        "  " * depth + _open_tag(a) for depth, a in enumerate(reversed(ancestors))
+    ]
+    lines.append("  " * len(ancestors) + "<!-- editable block -->")
+    return "\n".join(lines)
@@ -56,12 +56,13 @@ def assert_no_forbidden_xsl(fixed_elem: etree._Element):
 # 4. Output XPath existence check (post-merge)
 # =========================
 
-def assert_output_xpath_exists(xslt_string: str, output_xpath: str):
+def assert_output_xpath_exists(xslt, output_xpath: str):
     """
     Validate that the output XPath is now produced by the XSLT.
     Static structural check (not execution-based).
+    Accepts the XSLT as text or as an already-parsed tree.
     """
-    xslt_root = etree.XML(xslt_string.encode())
+    xslt_root = etree.XML(xslt.encode()) if isinstance(xslt, str) else xslt
     target = output_xpath.strip("/").split("/")[-1]
 
     for elem in xslt_root.iter():
@@ -71,3 +72,62 @@ def assert_output_xpath_exists(xslt_string: str, output_xpath: str):
     raise ValueError(
         f"Post-merge validation failed: output XPath not found: {output_xpath}"
     )
+
+def missing_output_xpaths(xslt, output_xpaths):
+    """
+    Batch form of assert_output_xpath_exists: one pass over the XSLT,
+    returning the output XPaths whose leaf is not produced anywhere.
+    """
+    xslt_root = etree.XML(xslt.encode()) if isinstance(xslt, str) else xslt
+    produced = {
+        etree.QName(elem).localname
+        for elem in xslt_root.iter()
+        if isinstance(elem.tag, str)
+    }
+    return [
+        xp for xp in output_xpaths
+        if xp.strip("/").split("/")[-1] not in produced
+    ]
+
+
+def assert_output_xpaths_exist(xslt, output_xpaths):
+    missing = missing_output_xpaths(xslt, output_xpaths)
+    if missing:
+        raise ValueError(
+            f"Post-merge validation failed: output XPath not found: "
+            f"{', '.join(missing)}"
+        )
+
+# =========================
+# 5. Compilation check (post-merge)
+# =========================
+
+def xslt_compiles(xslt_root) -> bool:
+    try:
+        etree.XSLT(xslt_root)
+        return True
+    except Exception:
+        return False
+
+# =========================
+# 6. Execution-based knockout check
+# =========================
+
+def assert_knockout_passes(xslt, samples, pool=None, time_budget=None):
+    """
+    Run the patched XSLT on sample inputs and require every diff's
+    output path count to match its target_count.
+    """
+    from knockout import knockout_validate
+
+    failed = [c for c in knockout_validate(xslt, samples, pool, time_budget)
+              if not c.passed]
+    if failed:
+        raise ValueError(
+            f"Knockout validation failed for {len(failed)} diff(s): "
+            + "; ".join(
+                f"{c.xpath} [{c.sample}] {c.status} "
+                f"(expected {c.expected}, got {c.observed})"
+                for c in failed[:5]
+            )
+        )
@@ -1,10 +1,17 @@
+import logging
 from lxml import etree
 from typing import Optional, List
 
+from defuse import DefUseIndex
+from instrument import timed
+from output_index import OutputIndex
+
 
 XSL_NS = "http://www.w3.org/1999/XSL/Transform"
 NSMAP = {"xsl": XSL_NS}
 
+log = logging.getLogger(__name__)
+
 
 prompt_t = """You are an expert XSLT engineer.
 You are fixing a SMALL, ISOLATED XSLT fragment extracted from a larger monolithic stylesheet.
@@ -17,7 +24,7 @@ Expected Behavior:
 {expected_rule}
 
 {optional_expected_source_xpath_block}
-
+{dependencies_block}
 === XSLT SLICE (EDITABLE) ===
 {xslt_slice}
 
@@ -25,7 +32,7 @@ Expected Behavior:
 1. Modify ONLY the provided XSLT slice.
 2. Do NOT refactor, rename, or reformat unrelated parts.
 3. Do NOT introduce new templates, modes, or apply-templates.
-4. Do NOT assume any context outside this slice.
+4. Do NOT assume any context outside this slice and the read-only definitions.
 5. Preserve existing structure, ordering, and namespaces.
 6. Output MUST be valid XSLT/XML.
 7. Return ONLY the corrected XSLT slice. No explanations.
@@ -76,40 +83,71 @@ def find_behavioral_boundary(node: etree._Element) -> etree._Element:
 
 
 
-def collect_dependencies(boundary: etree._Element) -> List[etree._Element]:
+def collect_dependencies(
+    boundary: etree._Element, defuse: DefUseIndex = None
+) -> List[etree._Element]:
     """
-    Collect variable declarations and value-of instructions
-    used within the boundary.
+    xsl:variable / xsl:param definitions outside the boundary that it
+    uses, directly or transitively, in document order.
     """
-    deps = []
-    for elem in boundary.iter():
-        if elem.tag in {
-            f"{{{XSL_NS}}}variable",
-            f"{{{XSL_NS}}}value-of",
-            f"{{{XSL_NS}}}attribute",
-        }:
-            deps.append(elem)
-    return deps
+    defuse = defuse or DefUseIndex(boundary.getroottree().getroot())
+    return defuse.dependencies(boundary)
 
 
-def extract_xslt_slice(xslt_str: str, diff: dict) -> str:
-    xslt_root = etree.XML(xslt_str.encode())
-    output_xpath = diff["output_xpath"]
+def dependency_context(boundary: etree._Element, defuse: DefUseIndex = None) -> str:
+    """Read-only text of the definitions a slice depends on."""
+    return "\n".join(
+        etree.tostring(d, encoding="unicode", with_tail=False).strip()
+        for d in collect_dependencies(boundary, defuse)
+    )
 
+
+def locate_slice_boundary(xslt_root: etree._Element, output_xpath: str) -> etree._Element:
     anchor_node, missing_tail = find_nearest_existing_output_node(xslt_root, output_xpath)
 
     if anchor_node is None:
         raise ValueError(f"Cannot locate any parent for {output_xpath}")
 
-    boundary = find_behavioral_boundary(anchor_node)
+    return find_behavioral_boundary(anchor_node)
+
+
+def extract_xslt_slice(xslt_str: str, diff: dict) -> str:
+    return extract_xslt_slice_with_context(xslt_str, diff)[0]
+
+
+def extract_xslt_slice_with_context(xslt_str: str, diff: dict):
+    """
+    (slice, dependencies) from one parse: the editable slice text and
+    the read-only xsl:variable / xsl:param definitions it uses.
+    """
+    xslt_root = etree.XML(xslt_str.encode())
+    boundary = locate_slice_boundary(xslt_root, diff["output_xpath"])
 
     slice_copy = etree.fromstring(etree.tostring(boundary))
 
-    return etree.tostring(
+    xslt_slice = etree.tostring(
         slice_copy,
         pretty_print=True,
         encoding="unicode"
     )
+    return xslt_slice, dependency_context(boundary, DefUseIndex(xslt_root))
+
+
+def build_slice_prompt(diff: dict, xslt_slice: str, dependencies: str = "") -> str:
+    source = diff.get("expected_source_xpath")
+    return prompt_t.format(
+        output_xpath=diff["output_xpath"],
+        status=diff.get("status") or diff.get("diff_type", ""),
+        expected_rule=diff.get("expected_rule", ""),
+        optional_expected_source_xpath_block=(
+            f"Expected Source XPath: {source}" if source else ""
+        ),
+        dependencies_block=(
+            f"\n=== DEFINITIONS USED BY THE SLICE (READ-ONLY) ===\n{dependencies}\n"
+            if dependencies else ""
+        ),
+        xslt_slice=xslt_slice,
+    )
 
 
 
@@ -144,16 +182,18 @@ def matches_output_node(elem: etree._Element, target_name: str) -> bool:
 
 
 
-def find_nearest_existing_output_node(xslt_root: etree._Element, output_xpath: str):
+@timed("locate")
+def find_nearest_existing_output_node(
+    xslt_root: etree._Element, output_xpath: str, index: OutputIndex = None
+):
     parts = output_xpath.strip("/").split("/")
+    index = index or OutputIndex(xslt_root)
 
     # Try deepest → shallowest
     for i in range(len(parts), 0, -1):
-        candidate = parts[i - 1]
-
-        for elem in xslt_root.iter():
-            if matches_output_node(elem, candidate):
-                return elem, parts[i:]  # remaining missing path
+        candidates = index.candidates(parts[i - 1])
+        if candidates:
+            return candidates[0], parts[i:]  # remaining missing path
 
     return None, None
 
@@ -163,10 +203,9 @@ def find_output_node(xslt_root: etree._Element, output_xpath: str) -> Optional[e
     Locate the XSLT node responsible for producing the final element in output_xpath.
     """
     target_name = output_xpath.strip("/").split("/")[-1]
-    print(target_name)
+    log.debug("Looking for producer of %s", target_name)
 
     for elem in xslt_root.iter():
-        print(elem.tag)
         if matches_output_node(elem, target_name):
             return elem
 
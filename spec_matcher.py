@@ -1,5 +1,79 @@
+import re
+
+_STEP = re.compile(r"^([^\[]*)(?:\[(\d+)\])?")
+
+
+def path_steps(xpath):
+    """'/A[1]/B/C[3]' -> [('A', '1'), ('B', None), ('C', '3')]"""
+    return [_STEP.match(s).groups() for s in xpath.split("/") if s]
+
+
+class SpecTrie:
+    """
+    Path-segment trie over spec output_xpath values.
+
+    A diff matches every spec whose path is a whole-segment ancestor (or
+    equal) of the diff path, so /A/BC does not match /A/B. A spec step
+    without a predicate matches any position; a spec step like C[3]
+    only matches diff steps at position 3.
+    """
+
+    def __init__(self, specs=()):
+        self._root = {}
+        self._size = 0
+        for spec in specs:
+            self.add(spec)
+
+    def add(self, spec):
+        node = self._root
+        for name, pos in path_steps(spec["output_xpath"]):
+            node = node.setdefault((name, pos), {})
+        node.setdefault(None, []).append((self._size, spec))
+        self._size += 1
+
+    def match(self, diff_xpath):
+        """All ancestor-or-self specs, in the order they were added."""
+        frontier = [self._root]
+        matched = list(self._root.get(None, ()))
+
+        for name, pos in path_steps(diff_xpath):
+            keys = [(name, None)] if pos is None else [(name, None), (name, pos)]
+            frontier = [n[k] for n in frontier for k in keys if k in n]
+            if not frontier:
+                break
+            for node in frontier:
+                matched.extend(node.get(None, ()))
+
+        return [spec for _, spec in sorted(matched, key=lambda m: m[0])]
+
+    def match_all(self, diffs):
+        """
+        Match a batch of diffs (models.Diff or diff dicts); returns a
+        list of spec lists parallel to diffs.
+        """
+        return [self.match(diff_xpath_of(d)) for d in diffs]
+
+
+def diff_xpath_of(diff):
+    if isinstance(diff, dict):
+        return diff.get("output_xpath") or diff["xpath"]
+    return diff.xpath
+
+
+def spec_trie(specs) -> SpecTrie:
+    """specs as a SpecTrie; a prebuilt trie is returned as is."""
+    return specs if isinstance(specs, SpecTrie) else SpecTrie(specs)
+
+
 def match_specs(diff_xpath, specs):
-    return [
-        s for s in specs
-        if diff_xpath.startswith(s["output_xpath"])
-    ]
+    """
+    Specs matching one diff path. specs may be a list or a SpecTrie;
+    when matching many diffs, build the SpecTrie once and pass it in
+    (or use match_specs_all).
+    """
+    return spec_trie(specs).match(diff_xpath)
+
+
+def match_specs_all(diffs, specs):
+    """match_specs for a batch of diffs; one spec list per diff."""
+    return spec_trie(specs).match_all(diffs)
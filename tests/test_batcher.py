@@ -0,0 +1,54 @@
+from batcher import Batch, Issue, XSLTTemplate, adaptive_merge, merge_by_template, pack_batches
+
+
+def batch(root, leaf="X"):
+    path = f"{root}/{leaf}"
+    return Batch(case="B", batch_root=root, issues=[Issue("B", path, 2, 1)])
+
+
+def test_unrelated_batches_are_not_packed_under_shallow_root():
+    packed = pack_batches([batch("/Root/A"), batch("/Other/B")], token_budget=10_000)
+    assert sorted(b.batch_root for b in packed) == ["/Other/B", "/Root/A"]
+
+
+def test_related_batches_share_one_call():
+    packed = pack_batches([batch("/Root/Sec/A"), batch("/Root/Sec/B")], token_budget=10_000)
+    assert [b.batch_root for b in packed] == ["/Root/Sec"]
+    assert len(packed[0].issues) == 2
+
+
+def test_merged_root_slice_is_costed_against_budget():
+    # The common root's slice is far larger than either member's
+    sizes = {"/Root/Sec/A": 40, "/Root/Sec/B": 40, "/Root/Sec": 40_000}
+
+    def slice_for(b):
+        return "x" * sizes[b.batch_root]
+
+    batches = [batch("/Root/Sec/A"), batch("/Root/Sec/B")]
+    packed = pack_batches(batches, token_budget=2_000, slice_for=slice_for)
+    assert sorted(b.batch_root for b in packed) == ["/Root/Sec/A", "/Root/Sec/B"]
+    assert all(b.estimated_tokens <= 2_000 for b in packed)
+
+
+def template(line):
+    return XSLTTemplate(match="x", output_paths=set(), line_start=line, line_end=line + 1)
+
+
+def test_template_merge_keeps_diff_order():
+    shared = template(10)
+    first, second = batch("/Root/A"), batch("/Root/B")
+    first.responsible_templates = [shared]
+    second.responsible_templates = [shared]
+    loose = batch("/Other/C")
+    merged = merge_by_template([first, loose, second])
+    assert [b.batch_root for b in merged] == ["/Root", "/Other/C"]
+
+
+def test_merged_batches_list_each_template_once():
+    shared, own = template(10), template(20)
+    first, second = batch("/Root/Sec/A"), batch("/Root/Sec/B")
+    first.responsible_templates = [shared]
+    second.responsible_templates = [own, shared]
+    for merged in (adaptive_merge([first, second]), pack_batches([first, second], 10_000)):
+        assert [len(b.responsible_templates) for b in merged] == [2]
+        assert merged[0].responsible_templates == [shared, own]
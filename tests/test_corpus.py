@@ -0,0 +1,31 @@
+from corpus import CorpusReport, regressions
+
+
+def record(xpath, output_count, target_count, diff_type="COUNT_MISMATCH"):
+    return {
+        "xpath": xpath,
+        "diff_type": diff_type,
+        "output_count": output_count,
+        "target_count": target_count,
+    }
+
+
+def test_fixing_a_baseline_error_is_not_a_regression():
+    baseline = CorpusReport(errors={"p1": "XSLTApplyError: boom"})
+    candidate = CorpusReport(per_pair={"p1": [record("/A/B", 1, 2)]})
+    assert regressions(baseline, candidate) == []
+
+
+def test_new_and_worse_diffs_are_regressions():
+    baseline = CorpusReport(per_pair={"p1": [record("/A/B", 1, 2)]})
+    candidate = CorpusReport(per_pair={"p1": [record("/A/B", 0, 2), record("/A/C", 1, 0, "EXTRA")]})
+    assert regressions(baseline, candidate) == [
+        "p1: worse COUNT_MISMATCH /A/B",
+        "p1: new EXTRA /A/C",
+    ]
+
+
+def test_new_error_is_a_regression():
+    baseline = CorpusReport(per_pair={"p1": []})
+    candidate = CorpusReport(errors={"p1": "XSLTApplyError: boom"})
+    assert regressions(baseline, candidate) == ["p1: XSLTApplyError: boom"]
@@ -0,0 +1,34 @@
+from knockout import Sample, TransformPool, knockout_validate
+
+# 2**n recursive calls: fast for small n, effectively endless for large n
+XSLT = """<xsl:stylesheet version="1.0" xmlns:xsl="http://www.w3.org/1999/XSL/Transform">
+  <xsl:template match="/">
+    <r><x/><xsl:call-template name="f"><xsl:with-param name="n" select="number(/n)"/></xsl:call-template></r>
+  </xsl:template>
+  <xsl:template name="f">
+    <xsl:param name="n"/>
+    <xsl:if test="$n &gt; 0">
+      <xsl:call-template name="f"><xsl:with-param name="n" select="$n - 1"/></xsl:call-template>
+      <xsl:call-template name="f"><xsl:with-param name="n" select="$n - 1"/></xsl:call-template>
+    </xsl:if>
+  </xsl:template>
+</xsl:stylesheet>"""
+
+DIFFS = [{"xpath": "/r[1]/x[1]", "target_count": 1}]
+
+
+def test_hung_sample_does_not_block_later_calls():
+    with TransformPool(workers=1) as pool:
+        hung = Sample("hung", "<n>60</n>", DIFFS)
+        checks = knockout_validate(XSLT, [hung], pool, time_budget=0.5)
+        assert [c.status for c in checks] == ["TIMEOUT"]
+
+        quick = Sample("quick", "<n>1</n>", DIFFS)
+        checks = knockout_validate(XSLT, [quick], pool, time_budget=10)
+        assert [c.status for c in checks] == ["PASS"]
+
+
+def test_own_pool_is_torn_down_after_timeout():
+    hung = Sample("hung", "<n>60</n>", DIFFS)
+    checks = knockout_validate(XSLT, [hung], time_budget=0.5)
+    assert [c.status for c in checks] == ["TIMEOUT"]
@@ -0,0 +1,66 @@
+import sqlite3
+
+from llm_cache import ResponseCache, cache_key, cached_llm
+
+
+def counting_llm(answer="<fix/>"):
+    calls = []
+
+    def llm(prompt):
+        calls.append(prompt)
+        return answer
+    return llm, calls
+
+
+def test_rejected_response_is_asked_again(tmp_path):
+    llm, calls = counting_llm()
+    with ResponseCache(str(tmp_path / "c.sqlite")) as cache:
+        wrapped = cached_llm(llm, cache)
+        wrapped("p")
+        wrapped.settle("p", False)
+        wrapped("p")
+        assert len(calls) == 2
+        assert cache.get(cache_key("p")) is None
+
+
+def test_accepted_response_is_replayed(tmp_path):
+    llm, calls = counting_llm()
+    with ResponseCache(str(tmp_path / "c.sqlite")) as cache:
+        wrapped = cached_llm(llm, cache)
+        wrapped("p")
+        wrapped.settle("p", True)
+        assert wrapped("p") == "<fix/>"
+        assert len(calls) == 1
+
+
+def test_rejecting_a_cached_response_evicts_it(tmp_path):
+    llm, calls = counting_llm()
+    with ResponseCache(str(tmp_path / "c.sqlite")) as cache:
+        cache.put(cache_key("p"), "<stale/>")
+        wrapped = cached_llm(llm, cache)
+        assert wrapped("p") == "<stale/>"
+        wrapped.settle("p", False)
+        assert wrapped("p") == "<fix/>"
+        assert len(calls) == 1
+
+
+def test_lookups_are_buffered_until_flush(tmp_path):
+    path = str(tmp_path / "c.sqlite")
+    cache = ResponseCache(path)
+    cache.put("k", "v")
+    for _ in range(3):
+        cache.get("k")
+    cache.get("missing")
+
+    def on_disk():
+        with sqlite3.connect(path) as db:
+            hits = db.execute("SELECT hits FROM responses WHERE key = 'k'").fetchone()[0]
+            return hits, dict(db.execute("SELECT name, value FROM stats"))
+
+    assert on_disk() == (0, {})
+    cache.close()
+    assert on_disk() == (3, {"hits": 3, "misses": 1})
+
+    with ResponseCache(path) as reopened:
+        stats = reopened.stats()
+    assert (stats["lifetime_hits"], stats["lifetime_misses"]) == (3, 1)
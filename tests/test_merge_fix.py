@@ -0,0 +1,27 @@
+from merge_fix import replace_xslt_slices
+
+XSLT = """<xsl:stylesheet version="1.0" xmlns:xsl="http://www.w3.org/1999/XSL/Transform">
+  <xsl:template match="/">
+    <Root>
+      <xsl:for-each select="a"><A><xsl:value-of select="."/></A></xsl:for-each>
+      <xsl:for-each select="b"><B><xsl:value-of select="."/></B></xsl:for-each>
+    </Root>
+  </xsl:template>
+</xsl:stylesheet>"""
+
+GOOD = '<A><xsl:value-of select="@v"/></A>'
+# xsl:value-of without select does not compile
+BROKEN = '<B><xsl:value-of/></B>'
+
+
+def test_uncompilable_batch_leaves_stylesheet_unchanged():
+    result, skipped = replace_xslt_slices(XSLT, [("/Root/A", GOOD), ("/Root/B", BROKEN)])
+    assert sorted(xp for xp, _ in skipped) == ["/Root/A", "/Root/B"]
+    assert all("does not compile" in reason for _, reason in skipped)
+    assert 'select="@v"' not in result
+
+
+def test_compilable_batch_is_applied():
+    result, skipped = replace_xslt_slices(XSLT, [("/Root/A", GOOD)])
+    assert skipped == []
+    assert 'select="@v"' in result
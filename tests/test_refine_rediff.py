@@ -0,0 +1,105 @@
+import json
+
+from lxml import etree
+
+from new import DiffTracker, patch_output_prefix, refine_xslt
+from xml_diff import count_diffs
+
+XSLT = """<xsl:stylesheet version="1.0" xmlns:xsl="http://www.w3.org/1999/XSL/Transform">
+  <xsl:template match="/">
+    <Root>
+      <A><xsl:for-each select="in/a"><Item><X/></Item></xsl:for-each></A>
+      <B><xsl:for-each select="in/b"><Item><Y/></Item></xsl:for-each></B>
+    </Root>
+  </xsl:template>
+</xsl:stylesheet>"""
+
+INPUT = "<in><a/><a/><b/><b/></in>"
+TARGET = "<Root><A><Item><X/></Item><Item><X/></Item></A><B><Item><Z/></Item><Item><Z/></Item></B></Root>"
+
+DIFFS = [
+    {"output_xpath": "/Root/B/Item/Y", "diff_type": "EXTRA", "output_count": 2, "target_count": 0},
+    # Stale: the output already matches the target here
+    {"output_xpath": "/Root/A/Item/X", "diff_type": "COUNT_MISMATCH", "output_count": 1, "target_count": 2},
+]
+
+FIX = '<xsl:for-each xmlns:xsl="http://www.w3.org/1999/XSL/Transform" select="in/b"><Item><Z/></Item></xsl:for-each>'
+
+
+def test_patch_prefix_is_enclosing_output_path():
+    root = etree.XML(XSLT.encode())
+    loops = list(root.iter("{http://www.w3.org/1999/XSL/Transform}for-each"))
+    assert [patch_output_prefix(n) for n in loops] == ["/Root/A", "/Root/B"]
+
+
+def test_refine_rediffs_patched_subtree_and_skips_resolved_anchors():
+    prompts = []
+
+    def llm(prompt):
+        prompts.append(prompt)
+        return FIX
+
+    tracked = []
+    refresh = DiffTracker.refresh
+
+    def check_refresh(self, xslt_root, loop_nodes):
+        refresh(self, xslt_root, loop_nodes)
+        full = count_diffs(etree.XSLT(xslt_root)(self.input_doc), self.target)
+        tracked.append(self.diffs == full)
+
+    DiffTracker.refresh = check_refresh
+    try:
+        result = refine_xslt(XSLT, DIFFS, llm=llm, input_xml=INPUT, target_xml=TARGET)
+    finally:
+        DiffTracker.refresh = refresh
+
+    assert len(prompts) == 1 and "/Root/B/Item/Y" in prompts[0]
+    assert tracked == [True]
+    assert "<Z/>" in result
+
+
+NESTED_XSLT = """<xsl:stylesheet version="1.0" xmlns:xsl="http://www.w3.org/1999/XSL/Transform">
+  <xsl:template match="/">
+    <Root>
+      <Outer>
+        <xsl:for-each select="in/o">
+          <A>
+            <X/>
+            <Inner><xsl:for-each select="i"><C><B/></C></xsl:for-each></Inner>
+          </A>
+        </xsl:for-each>
+      </Outer>
+    </Root>
+  </xsl:template>
+</xsl:stylesheet>"""
+
+NESTED_INPUT = "<in><o><i/></o></in>"
+NESTED_TARGET = "<Root><Outer><A><Inner><C><B/><B/></C></Inner></A></Outer></Root>"
+
+NESTED_DIFFS = [
+    {"output_xpath": "/Root/Outer/A/X", "diff_type": "EXTRA", "output_count": 1, "target_count": 0},
+    {"output_xpath": "/Root/Outer/A/Inner/C/B", "diff_type": "COUNT_MISMATCH",
+     "output_count": 1, "target_count": 2},
+]
+
+# Replaces the outer loop and drops the inner one with it
+OUTER_FIX = '<xsl:for-each xmlns:xsl="http://www.w3.org/1999/XSL/Transform" select="in/o"><A/></xsl:for-each>'
+
+
+def test_group_whose_loop_cannot_be_resolved_is_not_locked(tmp_path):
+    prompts = []
+
+    def llm(prompt):
+        prompts.append(prompt)
+        return OUTER_FIX
+
+    checkpoint = tmp_path / "refine.checkpoint.json"
+    result = refine_xslt(
+        NESTED_XSLT, NESTED_DIFFS, llm=llm, checkpoint_path=str(checkpoint),
+        input_xml=NESTED_INPUT, target_xml=NESTED_TARGET,
+    )
+
+    assert len(prompts) == 1
+    assert "<Inner>" not in result
+    locked = json.loads(checkpoint.read_text())["locked"]
+    assert locked == ["/Root/Outer/A/X"]
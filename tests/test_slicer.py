@@ -0,0 +1,28 @@
+from slicer import build_slice_prompt, extract_xslt_slice, extract_xslt_slice_with_context
+
+XSLT = """<xsl:stylesheet version="1.0" xmlns:xsl="http://www.w3.org/1999/XSL/Transform">
+  <xsl:variable name="currency" select="'EUR'"/>
+  <xsl:variable name="unused" select="1"/>
+  <xsl:template match="/">
+    <Invoice>
+      <xsl:variable name="rate" select="concat($currency, ':1')"/>
+      <Total><Rate><xsl:value-of select="$rate"/></Rate></Total>
+    </Invoice>
+  </xsl:template>
+</xsl:stylesheet>"""
+
+DIFF = {"output_xpath": "/Invoice/Total/Rate", "status": "COUNT_MISMATCH"}
+
+
+def test_slice_context_carries_transitive_definitions():
+    xslt_slice, dependencies = extract_xslt_slice_with_context(XSLT, DIFF)
+    assert xslt_slice == extract_xslt_slice(XSLT, DIFF)
+    assert 'name="currency"' in dependencies
+    assert 'name="rate"' in dependencies
+    assert 'name="unused"' not in dependencies
+
+
+def test_slice_prompt_includes_read_only_definitions():
+    prompt = build_slice_prompt(DIFF, *extract_xslt_slice_with_context(XSLT, DIFF))
+    definitions = prompt.index("DEFINITIONS USED BY THE SLICE (READ-ONLY)")
+    assert definitions < prompt.index('name="rate"') < prompt.index("XSLT SLICE (EDITABLE)")
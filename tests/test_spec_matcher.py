@@ -0,0 +1,29 @@
+from spec_matcher import SpecTrie, match_specs, match_specs_all, spec_trie
+
+SPECS = [
+    {"output_xpath": "/A"},
+    {"output_xpath": "/A/B"},
+    {"output_xpath": "/A/B/C[3]"},
+]
+
+
+def test_match_is_segment_wise_and_positional():
+    assert match_specs("/A/BC", SPECS) == [SPECS[0]]
+    assert match_specs("/A[1]/B[2]/C[3]", SPECS) == SPECS
+    assert match_specs("/A/B/C[2]", SPECS) == SPECS[:2]
+
+
+def test_matches_keep_spec_list_order():
+    specs = [{"output_xpath": "/A/B/C"}, {"output_xpath": "/A"}, {"output_xpath": "/A/B"}]
+    assert match_specs("/A/B/C/D", specs) == specs
+
+
+def test_prebuilt_trie_is_used_as_is():
+    trie = SpecTrie(SPECS)
+    assert spec_trie(trie) is trie
+    assert match_specs("/A/B", trie) == SPECS[:2]
+
+
+def test_match_all_is_parallel_to_diffs():
+    diffs = [{"xpath": "/A/B"}, {"xpath": "/X", "output_xpath": "/A/BC"}]
+    assert match_specs_all(diffs, SPECS) == [SPECS[:2], SPECS[:1]]
@@ -0,0 +1,22 @@
+from lxml import etree
+
+from models import Diff
+from xslt_slice import find_slice
+
+XSLT = """<xsl:stylesheet version="1.0" xmlns:xsl="http://www.w3.org/1999/XSL/Transform">
+  <xsl:template match="/">
+    <xsl:for-each select="a">
+      <xsl:element name="Item"/>
+    </xsl:for-each>
+    <xsl:if test="b">
+      <Item/>
+    </xsl:if>
+  </xsl:template>
+</xsl:stylesheet>"""
+
+
+def test_literal_producers_are_preferred_over_xsl_element():
+    tree = etree.fromstring(XSLT)
+    cluster = [Diff("/Root/Item", "MISSING")]
+    found = find_slice(tree, cluster, [])
+    assert etree.QName(found.fragment_node).localname == "if"
@@ -0,0 +1,43 @@
+from xslt_slicer import SourceMap, extract_slice
+
+
+def test_span_skips_tag_names_in_same_line_comment():
+    source_map, root = SourceMap.parse("<A><B><!-- <B> --><B/></B></A>")
+    text, _ = extract_slice(source_map, root[0][1])
+    assert text == "<B/>"
+
+
+def test_span_skips_tag_names_in_same_line_cdata():
+    source_map, root = SourceMap.parse("<A><X><![CDATA[<B>]]></X><B><C/></B></A>")
+    text, _ = extract_slice(source_map, root.find("B"))
+    assert text == "<B><C/></B>"
+
+
+def test_span_of_repeated_tag_after_comment():
+    source_map, root = SourceMap.parse("<A><B>1</B><!-- <B> --><B>2</B></A>")
+    text, span = extract_slice(source_map, root.findall("B")[1])
+    assert text == "<B>2</B>"
+    assert (span.start_line, span.end_line) == (0, 1)
+
+
+def test_span_of_start_tag_with_attributes_on_later_line():
+    source_map, root = SourceMap.parse('<A>\n<B\n  x="1">\n<C/></B><B/></A>')
+    first, second = root.findall("B")
+    assert extract_slice(source_map, first)[0] == '<B\n  x="1">\n<C/></B>'
+    assert extract_slice(source_map, second)[0] == "<B/>"
+    assert extract_slice(source_map, first)[1].start_line == 1
+
+
+def test_span_of_self_closing_tag_split_across_lines():
+    source_map, root = SourceMap.parse('<A>\n  <B\n     y="1"/><B>2</B>\n</A>')
+    first, second = root.findall("B")
+    assert extract_slice(source_map, first)[0] == '<B\n     y="1"/>'
+    assert extract_slice(source_map, second)[0] == "<B>2</B>"
+
+
+def test_span_of_root_tag_split_across_lines():
+    text = '<xsl:stylesheet version="1.0"\n    xmlns:xsl="http://www.w3.org/1999/XSL/Transform">\n</xsl:stylesheet>'
+    source_map, root = SourceMap.parse(text)
+    text_, span = extract_slice(source_map, root)
+    assert text_ == text
+    assert (span.start_line, span.end_line) == (0, 3)
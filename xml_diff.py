@@ -1,28 +1,351 @@
+import io
+import os
+import re
+import sys
+from collections import Counter
+from itertools import zip_longest
+
 from lxml import etree
+
+from instrument import timed
 from models import Diff
 
-def diff_xml(output_xml: str, target_xml: str):
-    out = etree.fromstring(output_xml.encode())
-    tgt = etree.fromstring(target_xml.encode())
-    diffs = []
-
-    def walk(o, t, path):
-        if o is None and t is not None:
-            diffs.append(Diff(path, "MISSING"))
-            return
-        if o is not None and t is None:
-            diffs.append(Diff(path, "EXTRA"))
-            return
-        if o.tag != t.tag or (o.text or "").strip() != (t.text or "").strip():
-            diffs.append(Diff(path, "VALUE_MISMATCH"))
-
-        oc, tc = list(o), list(t)
-        for i in range(max(len(oc), len(tc))):
-            walk(
-                oc[i] if i < len(oc) else None,
-                tc[i] if i < len(tc) else None,
-                f"{path}/{o.tag.split('}')[-1]}[{i+1}]"
-            )
-
-    walk(out, tgt, "")
-    return diffs
+
+def _open_source(xml):
+    """
+    Accept XML text, bytes, a file path or a file object for iterparse.
+    """
+    if isinstance(xml, bytes):
+        return io.BytesIO(xml)
+    if isinstance(xml, str):
+        if xml.lstrip().startswith("<"):
+            return io.BytesIO(xml.encode())
+        if os.path.exists(xml):
+            return xml
+        return io.BytesIO(xml.encode())
+    return xml
+
+
+_PREDICATE = re.compile(r"\[[^\]]*\]")
+
+
+def _is_tree(xml) -> bool:
+    return isinstance(xml, (etree._Element, etree._ElementTree))
+
+
+def _tree_root(xml):
+    return xml.getroot() if isinstance(xml, etree._ElementTree) else xml
+
+
+def prefix_steps(prefix) -> tuple:
+    """'/ns0:A[1]/B[2]' -> ('A', 'B'); None or '/' -> ()."""
+    if not prefix:
+        return ()
+    steps = _PREDICATE.sub("", prefix).strip("/").split("/")
+    return tuple(s.split(":")[-1] for s in steps if s)
+
+
+def unindexed(path: str) -> str:
+    return "/" + "/".join(prefix_steps(path))
+
+
+def under_prefix(path: str, prefix: str) -> bool:
+    """True if path (indexed or not) is prefix or lies below it."""
+    if not prefix or prefix == "/":
+        return True
+    path = unindexed(path)
+    return path == prefix or path.startswith(prefix + "/")
+
+
+def _subtree_roots(root, steps):
+    """
+    (element, indexed path) for every element whose local-name path is
+    steps, descending only through matching children.
+    """
+    if etree.QName(root).localname != steps[0]:
+        return []
+    level = [(root, f"/{steps[0]}[1]")]
+    for step in steps[1:]:
+        below = []
+        for node, path in level:
+            n = 0
+            for child in node:
+                if isinstance(child.tag, str) and etree.QName(child).localname == step:
+                    n += 1
+                    below.append((child, f"{path}/{step}[{n}]"))
+        level = below
+    return level
+
+
+def _iter_tree_elements(root, steps):
+    """iter_elements over the subtrees of a parsed tree at steps."""
+    seq = 0
+    for top, top_path in _subtree_roots(root, steps):
+        parent_path = top_path.rsplit("/", 1)[0]
+        stack = [(parent_path, {})]
+        for event, elem in etree.iterwalk(top, events=("start", "end")):
+            if not isinstance(elem.tag, str):
+                continue
+            if event == "start":
+                if elem is top:
+                    stack.append((top_path, {}))
+                    continue
+                siblings = stack[-1][1]
+                tag = etree.QName(elem).localname
+                n = siblings.get(tag, 0) + 1
+                siblings[tag] = n
+                stack.append((f"{stack[-1][0]}/{tag}[{n}]", {}))
+                continue
+            path, _ = stack.pop()
+            yield seq, path, stack[-1][0], (elem.text or "").strip()
+            seq += 1
+
+
+def iter_elements(xml, prefix=None):
+    """
+    Stream (seq, path, parent_path, text) for every element in document
+    order. Steps are indexed by tag occurrence among siblings, e.g.
+    /Items[1]/Item[3]/Price[1], so an inserted sibling of another tag
+    does not shift the positions of its neighbours.
+
+    Uses an explicit stack and clears elements as soon as they end, so
+    neither Python recursion nor the full tree is kept around.
+
+    With prefix (an output path such as /Invoice/Lines), only elements
+    at or below it are yielded. Given an already parsed tree, only those
+    subtrees are visited at all.
+    """
+    steps = prefix_steps(prefix)
+    if _is_tree(xml):
+        root = _tree_root(xml)
+        if steps:
+            yield from _iter_tree_elements(root, steps)
+        else:
+            yield from _iter_tree_elements(root, (etree.QName(root).localname,))
+        return
+    prefix = "/" + "/".join(steps) if steps else None
+
+    stack = []      # (path, {tag: count}) of open ancestors
+    counters = {}   # occurrence counters for the document root
+    seq = 0
+
+    for event, elem in etree.iterparse(
+        _open_source(xml), events=("start", "end"), remove_comments=True,
+        remove_pis=True, huge_tree=True
+    ):
+        if event == "start":
+            siblings = stack[-1][1] if stack else counters
+            tag = etree.QName(elem).localname
+            n = siblings.get(tag, 0) + 1
+            siblings[tag] = n
+            parent_path = stack[-1][0] if stack else ""
+            stack.append((f"{parent_path}/{tag}[{n}]", {}))
+            continue
+
+        path, _ = stack.pop()
+        parent_path = stack[-1][0] if stack else ""
+        if prefix is None or under_prefix(path, prefix):
+            yield seq, path, parent_path, (elem.text or "").strip()
+            seq += 1
+
+        elem.clear()
+        parent = elem.getparent()
+        if parent is not None:
+            while elem.getprevious() is not None:
+                del parent[0]
+
+
+def iter_diff_xml(output_xml, target_xml, prefix=None):
+    """
+    Lazily yield Diff objects between two documents (or, with prefix,
+    between their subtrees at that output path).
+
+    Both documents are streamed in lockstep and joined on their indexed
+    paths. Matched elements with different text are yielded as
+    VALUE_MISMATCH immediately; elements left unmatched once both
+    streams end are yielded as MISSING / EXTRA, reported only at the
+    top of each unmatched subtree.
+    """
+    pending_out = {}
+    pending_tgt = {}
+
+    for o, t in zip_longest(
+        iter_elements(output_xml, prefix), iter_elements(target_xml, prefix)
+    ):
+        for rec, mine, other in ((o, pending_out, pending_tgt),
+                                 (t, pending_tgt, pending_out)):
+            if rec is None:
+                continue
+            path = rec[1]
+            match = other.pop(path, None)
+            if match is None:
+                mine[path] = rec
+                continue
+            if match[3] != rec[3]:
+                yield Diff(path, "VALUE_MISMATCH")
+
+    leftovers = [(rec, "EXTRA", pending_out) for rec in pending_out.values()]
+    leftovers += [(rec, "MISSING", pending_tgt) for rec in pending_tgt.values()]
+    leftovers.sort(key=lambda item: (item[0][0], item[1]))
+
+    for (_, path, parent_path, _), diff_type, side in leftovers:
+        if parent_path not in side:
+            yield Diff(path, diff_type)
+
+
+@timed("diff")
+def diff_xml(output_xml, target_xml, prefix=None):
+    return list(iter_diff_xml(output_xml, target_xml, prefix))
+
+
+# ============================================================
+# Aggregated path-count diffs (diffs.txt records)
+# ============================================================
+
+def _tree_counts(root, steps) -> Counter:
+    counts = Counter()
+    child_paths = {}
+    if steps:
+        tops = [node for node, _ in _subtree_roots(root, steps)]
+        base = "/" + "/".join(steps[:-1]) if len(steps) > 1 else ""
+    else:
+        tops, base = [root], ""
+
+    for top in tops:
+        stack = [base]
+        for event, elem in etree.iterwalk(top, events=("start", "end")):
+            if not isinstance(elem.tag, str):
+                continue
+            if event == "end":
+                stack.pop()
+                continue
+            key = (stack[-1], elem.tag)
+            path = child_paths.get(key)
+            if path is None:
+                path = sys.intern(f"{key[0]}/{etree.QName(elem).localname}")
+                child_paths[key] = path
+            counts[path] += 1
+            stack.append(path)
+    return counts
+
+
+def path_counts(xml, prefix=None) -> Counter:
+    """
+    Single-pass histogram of un-indexed local-name paths
+    (/IATA_OrderViewRS/Response/...) to their occurrence counts.
+    Path strings are built once per distinct (parent, tag) and interned.
+
+    With prefix, only paths at or below it are counted; a parsed tree
+    (e.g. an XSLT result) is then walked only under that prefix.
+    """
+    steps = prefix_steps(prefix)
+    if _is_tree(xml):
+        return _tree_counts(_tree_root(xml), steps)
+
+    counts = Counter()
+    child_paths = {}
+    stack = [""]
+
+    for event, elem in etree.iterparse(
+        _open_source(xml), events=("start", "end"), remove_comments=True,
+        remove_pis=True, huge_tree=True
+    ):
+        if event == "start":
+            key = (stack[-1], elem.tag)
+            path = child_paths.get(key)
+            if path is None:
+                path = sys.intern(f"{key[0]}/{etree.QName(elem).localname}")
+                child_paths[key] = path
+            counts[path] += 1
+            stack.append(path)
+            continue
+
+        stack.pop()
+        elem.clear()
+        parent = elem.getparent()
+        if parent is not None:
+            while elem.getprevious() is not None:
+                del parent[0]
+
+    if steps:
+        prefix = "/" + "/".join(steps)
+        return Counter({p: n for p, n in counts.items() if under_prefix(p, prefix)})
+    return counts
+
+
+@timed("diff")
+def count_diffs(output_xml, target_xml, prefix=None):
+    """
+    Join output and target path histograms into diffs.txt-style
+    records (MISSING / EXTRA / COUNT_MISMATCH), sorted by xpath.
+    """
+    out = path_counts(output_xml, prefix)
+    tgt = path_counts(target_xml, prefix)
+    return join_counts(out, tgt)
+
+
+def join_counts(out: Counter, tgt: Counter):
+    records = []
+    for path in sorted(out.keys() | tgt.keys()):
+        o, t = out.get(path, 0), tgt.get(path, 0)
+        if o == t:
+            continue
+        if o == 0:
+            diff_type = "MISSING"
+        elif t == 0:
+            diff_type = "EXTRA"
+        else:
+            diff_type = "COUNT_MISMATCH"
+        records.append({
+            "xpath": path,
+            "diff_type": diff_type,
+            "output_count": o,
+            "target_count": t,
+            "issue_category": "",
+            "in_output": o > 0,
+            "in_target": t > 0,
+        })
+    return records
+
+
+# ============================================================
+# Incremental re-diff
+# ============================================================
+
+def diff_path(d) -> str:
+    if isinstance(d, dict):
+        return d.get("xpath") or d["output_xpath"]
+    return d.xpath
+
+
+def splice_diffs(old_diffs, new_diffs, prefix):
+    """
+    Replace the records of old_diffs at or below prefix with new_diffs
+    (a re-diff of just that subtree). The replacements take the place
+    of the first dropped record, so the result has the same shape as a
+    full re-diff and termination.should_continue can compare the two.
+    """
+    prefix = unindexed(prefix) if prefix else None
+    kept, at = [], None
+    for d in old_diffs:
+        if under_prefix(diff_path(d), prefix):
+            if at is None:
+                at = len(kept)
+            continue
+        kept.append(d)
+    if at is None:
+        at = len(kept)
+    return kept[:at] + list(new_diffs) + kept[at:]
+
+
+def rediff_subtree(old_diffs, output_xml, target_xml, prefix, counts=False):
+    """
+    Re-diff only the output/target subtrees at prefix and splice the
+    result into old_diffs. counts=True works on count_diffs records,
+    otherwise on diff_xml Diff objects.
+    """
+    if counts:
+        new_diffs = count_diffs(output_xml, target_xml, prefix)
+    else:
+        new_diffs = diff_xml(output_xml, target_xml, prefix)
+    return splice_diffs(old_diffs, new_diffs, prefix)
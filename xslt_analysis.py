@@ -0,0 +1,179 @@
+from typing import Dict, List, Optional, Union
+
+from lxml import etree
+
+from batcher import XSLTTemplate
+from output_index import output_name
+from xslt_slicer import SourceMap
+
+XSL_NS = "http://www.w3.org/1999/XSL/Transform"
+XSL = f"{{{XSL_NS}}}"
+
+BLOCK_TAGS = {XSL + "template", XSL + "for-each"}
+
+
+def last_step(expr: str) -> str:
+    """'ns0:A/ns0:B[1]' -> 'B'"""
+    step = expr.strip().split("|")[0].rstrip("/").split("/")[-1]
+    return step.split("[")[0].split(":")[-1]
+
+
+def block_label(node) -> str:
+    if node.tag == XSL + "for-each":
+        return node.get("select", "")
+    if node.get("match") is not None:
+        return node.get("match")
+    return f"name:{node.get('name', '')}"
+
+
+class _Block:
+    def __init__(self, node, template):
+        self.node = node
+        self.template = template   # enclosing xsl:template node
+        self.paths = set()         # template-relative output paths
+        self.calls = []            # (relative prefix, xsl:call-template node)
+        self.applies = []          # (relative prefix, xsl:apply-templates node)
+
+
+def _scan(xslt_root):
+    """
+    One iterwalk over the stylesheet collecting, for every template and
+    for-each, the output paths it emits (relative to its template) and
+    its call-template / apply-templates sites.
+    """
+    blocks = []
+    open_blocks = []
+    out_stack = [""]
+    pushed = []
+
+    for event, el in etree.iterwalk(xslt_root, events=("start", "end")):
+        if not isinstance(el.tag, str):
+            continue
+
+        if event == "end":
+            if pushed.pop():
+                out_stack.pop()
+            if el.tag in BLOCK_TAGS:
+                open_blocks.pop()
+            continue
+
+        if el.tag == XSL + "template":
+            out_stack.append("")   # new template starts a fresh output path
+            pushed.append(True)
+            block = _Block(el, el)
+            blocks.append(block)
+            open_blocks.append(block)
+            continue
+
+        if el.tag == XSL + "for-each":
+            template = open_blocks[0].template if open_blocks else None
+            block = _Block(el, template)
+            blocks.append(block)
+            open_blocks.append(block)
+
+        name = output_name(el)
+        if name is not None:
+            path = f"{out_stack[-1]}/{name}"
+            out_stack.append(path)
+            pushed.append(True)
+            for block in open_blocks:
+                block.paths.add(path)
+        else:
+            pushed.append(False)
+
+        if el.tag == XSL + "call-template":
+            for block in open_blocks:
+                block.calls.append((out_stack[-1], el))
+        elif el.tag == XSL + "apply-templates":
+            for block in open_blocks:
+                block.applies.append((out_stack[-1], el))
+
+    return blocks
+
+
+def _apply_targets(apply_node, templates):
+    mode = apply_node.get("mode")
+    select = apply_node.get("select")
+    matched = []
+    for t in templates:
+        match = t.get("match")
+        if match is None or match == "/" or t.get("mode") != mode:
+            continue
+        if select is None or last_step(match) in ("*", last_step(select)):
+            matched.append(t)
+    return matched
+
+
+def analyze_templates(
+    xslt: Union[str, etree._Element], source_map: Optional[SourceMap] = None
+) -> List[XSLTTemplate]:
+    """
+    Static analysis of every xsl:template and xsl:for-each: the output
+    paths it can emit, its source line range and its call-template /
+    apply-templates dependencies.
+
+    Output paths are absolute for the match="/" template and anything
+    reachable from it through call-template / apply-templates; blocks in
+    templates that are never reached keep template-relative paths.
+
+    xslt is the stylesheet text, or a parsed root together with the
+    SourceMap it was parsed from. Line ranges come from the source text;
+    for a root without one, line_end is None.
+    """
+    if isinstance(xslt, str):
+        source_map, xslt_root = SourceMap.parse(xslt)
+    else:
+        xslt_root = xslt
+    blocks = _scan(xslt_root)
+    templates = [b.node for b in blocks if b.node.tag == XSL + "template"]
+    by_name = {t.get("name"): t for t in templates if t.get("name")}
+
+    # Absolute output prefixes each template can be instantiated under
+    prefixes: Dict[etree._Element, set] = {
+        t: ({""} if t.get("match") == "/" else set()) for t in templates
+    }
+    template_blocks = {b.node: b for b in blocks if b.node.tag == XSL + "template"}
+
+    for _ in range(len(templates)):
+        changed = False
+        for t in templates:
+            b = template_blocks[t]
+            sites = [(p, [by_name[c.get("name")]]) for p, c in b.calls
+                     if c.get("name") in by_name]
+            sites += [(p, _apply_targets(a, templates)) for p, a in b.applies]
+            for rel, targets in sites:
+                for target in targets:
+                    new = {q + rel for q in prefixes[t]} - prefixes[target]
+                    if new:
+                        prefixes[target] |= new
+                        changed = True
+        if not changed:
+            break
+
+    results = []
+    for b in blocks:
+        roots = prefixes.get(b.template) or set()
+        if roots:
+            paths = {q + p for q in roots for p in b.paths}
+        else:
+            paths = {p.lstrip("/") for p in b.paths}
+
+        deps = [f"call-template:{c.get('name')}" for _, c in b.calls]
+        deps += [
+            f"apply-templates:{a.get('select') or '*'}"
+            + (f"[mode={a.get('mode')}]" if a.get("mode") else "")
+            for _, a in b.applies
+        ]
+
+        results.append(
+            XSLTTemplate(
+                match=block_label(b.node),
+                output_paths=paths,
+                line_start=b.node.sourceline,
+                line_end=source_map.span(b.node).end_line if source_map else None,
+                dependencies=list(dict.fromkeys(deps)),
+                kind=etree.QName(b.node).localname,
+                node=b.node,
+            )
+        )
+    return results
@@ -1,7 +1,102 @@
+import hashlib
+from collections import OrderedDict
+
 from lxml import etree
 
+from instrument import span
+
+XSLT_CACHE_SIZE = 32
+INPUT_CACHE_SIZE = 8
+
+
+class LRUCache:
+    """
+    Small bounded LRU keyed by content hash, with hit/miss counters.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get(self, key):
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+_xslt_cache = LRUCache(XSLT_CACHE_SIZE)
+_input_cache = LRUCache(INPUT_CACHE_SIZE)
+
+
+def content_key(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def compile_xslt(xslt_str: str) -> etree.XSLT:
+    """
+    Return a compiled transform for xslt_str, reusing a cached one
+    when the same stylesheet text was compiled before.
+    """
+    key = content_key(xslt_str)
+    transform = _xslt_cache.get(key)
+    if transform is None:
+        with span("compile"):
+            transform = etree.XSLT(etree.XML(xslt_str.encode()))
+        _xslt_cache.put(key, transform)
+    return transform
+
+
+def parse_input(input_xml: str) -> etree._Element:
+    """
+    Parse an input document once; transforms never mutate their
+    input, so the parsed tree is safe to share between runs.
+    """
+    key = content_key(input_xml)
+    doc = _input_cache.get(key)
+    if doc is None:
+        doc = etree.XML(input_xml.encode())
+        _input_cache.put(key, doc)
+    return doc
+
+
 def run_xslt(xslt_str: str, input_xml: str) -> str:
-    xslt_tree = etree.XML(xslt_str.encode())
-    transform = etree.XSLT(xslt_tree)
-    result = transform(etree.XML(input_xml.encode()))
+    transform = compile_xslt(xslt_str)
+    doc = parse_input(input_xml)
+    with span("transform"):
+        result = transform(doc)
     return str(result)
+
+
+def cache_stats() -> dict:
+    return {"xslt": _xslt_cache.stats(), "input": _input_cache.stats()}
+
+
+def clear_caches():
+    _xslt_cache.clear()
+    _input_cache.clear()
@@ -1,5 +1,6 @@
 from lxml import etree
 from models import XSLTSlice
+from output_index import XSL_ELEMENT, OutputIndex
 
 XSL_NS = "http://www.w3.org/1999/XSL/Transform"
 NS = {"xsl": XSL_NS}
@@ -11,20 +12,16 @@ SAFE_BOUNDARIES = {
     f"{{{XSL_NS}}}template",
 }
 
-def find_slice(xslt_tree, cluster, specs):
+def find_slice(xslt_tree, cluster, specs, index: OutputIndex = None):
     target_name = cluster[0].xpath.split("/")[-1].split("[")[0]
+    index = index or OutputIndex(xslt_tree)
 
-    for el in xslt_tree.iter():
-        if not el.tag.startswith("{") and el.tag == target_name:
-            boundary = expand_to_boundary(el)
-            if boundary is not None:
-                return XSLTSlice(boundary, cluster, specs)
-
-    for el in xslt_tree.xpath("//xsl:element", namespaces=NS):
-        if el.get("name") == target_name:
-            boundary = expand_to_boundary(el)
-            if boundary is not None:
-                return XSLTSlice(boundary, cluster, specs)
+    # literal result elements first, then xsl:element producers
+    candidates = sorted(index.candidates(target_name), key=lambda el: el.tag == XSL_ELEMENT)
+    for el in candidates:
+        boundary = expand_to_boundary(el)
+        if boundary is not None:
+            return XSLTSlice(boundary, cluster, specs)
 
     return None
 
@@ -1,5 +1,11 @@
+import re
+from bisect import bisect_right
+from dataclasses import dataclass
+
 from lxml import etree
 
+from output_index import OutputIndex
+
 XSL_NS = "http://www.w3.org/1999/XSL/Transform"
 NS = {"xsl": XSL_NS}
 
@@ -10,18 +16,117 @@ SAFE_BOUNDARIES = {
     f"{{{XSL_NS}}}template",
 }
 
-def find_producing_nodes(xslt_tree, output_local_name):
-    nodes = []
+# Markup tokens needed to find where an element ends
+_TOKEN = re.compile(
+    r"<!--.*?-->|<!\[CDATA\[.*?\]\]>|<\?.*?\?>|<!DOCTYPE[^>]*>"
+    r"|<(/?)([^\s/>!?]+)(?:[^>\"']|\"[^\"]*\"|'[^']*')*?(/?)>",
+    re.S,
+)
+
+
+@dataclass(frozen=True)
+class SliceSpan:
+    """
+    Exact extent of an element in the original stylesheet text.
+    start/end are offsets into the text (end exclusive); start_line /
+    end_line are 0-based line indexes (end exclusive), as merge_slice
+    expects.
+    """
+    start: int
+    end: int
+    start_line: int
+    end_line: int
+
+
+class SourceMap:
+    """
+    Line-offset table over the original stylesheet text, built once.
+    Maps parsed nodes back to exact text spans via lxml sourceline,
+    without re-serializing the document.
+
+    lxml reports the line a start tag *ends* on, so start tags are
+    indexed by that line (one tokenizer pass, on first use); a tag whose
+    attributes span several lines is still found at its real "<".
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.line_offsets = [0] + [m.end() for m in re.finditer("\n", text)]
+        self._start_tags = None  # sourceline -> [(offset, qname)]
+
+    @classmethod
+    def parse(cls, text: str):
+        """Parse text and return (source_map, root) that agree on lines."""
+        return cls(text), etree.XML(text.encode())
+
+    def line_of(self, offset: int) -> int:
+        return bisect_right(self.line_offsets, offset) - 1
 
-    for el in xslt_tree.iter():
-        if not el.tag.startswith("{") and el.tag == output_local_name:
-            nodes.append(el)
+    def _start_offset(self, node) -> int:
+        line = node.sourceline
+        qname = node.tag.split("}")[-1]
+        if node.prefix:
+            qname = f"{node.prefix}:{qname}"
 
-    for el in xslt_tree.xpath("//xsl:element", namespaces=NS):
-        if el.get("name") == output_local_name:
-            nodes.append(el)
+        # Elements with the same tag whose start tag ends earlier on the line
+        skip = 0
+        cur = node
+        while cur is not None:
+            for sib in cur.itersiblings(preceding=True):
+                skip += sum(
+                    1 for el in sib.iter(node.tag) if el.sourceline == line
+                )
+                if sib.sourceline < line:
+                    break
+            cur = cur.getparent()
+            if cur is None or cur.sourceline < line:
+                break
+            if cur.tag == node.tag:
+                skip += 1
+
+        # Real start tags only: comments, CDATA and PIs are tokens too
+        for offset, name in self._tags_ending_on(line):
+            if name != qname:
+                continue
+            if skip == 0:
+                return offset
+            skip -= 1
+        raise RuntimeError("Slice not found")
+
+    def _tags_ending_on(self, line: int):
+        if self._start_tags is None:
+            self._start_tags = {}
+            for m in _TOKEN.finditer(self.text):
+                closing, name, _ = m.groups()
+                if name is None or closing:
+                    continue
+                end_line = self.line_of(m.end() - 1) + 1
+                self._start_tags.setdefault(end_line, []).append((m.start(), name))
+        return self._start_tags.get(line, ())
+
+    def span(self, node) -> SliceSpan:
+        start = self._start_offset(node)
+        depth = 0
+        for m in _TOKEN.finditer(self.text, start):
+            closing, name, self_closing = m.groups()
+            if name is None:
+                continue
+            if closing:
+                depth -= 1
+            elif not self_closing:
+                depth += 1
+            if depth == 0:
+                end = m.end()
+                break
+        else:
+            raise RuntimeError("Unterminated slice")
+
+        return SliceSpan(start, end, self.line_of(start), self.line_of(end - 1) + 1)
 
-    return nodes
+
+def find_producing_nodes(xslt_tree, output_local_name, index: OutputIndex = None):
+    index = index or OutputIndex(xslt_tree)
+    return list(index.candidates(output_local_name))
 
 
 def expand_to_safe_boundary(node):
@@ -33,15 +138,10 @@ def expand_to_safe_boundary(node):
     return None
 
 
-def extract_slice(xslt_tree, boundary_node):
-    full = etree.tostring(xslt_tree, pretty_print=True, encoding="unicode")
-    frag = etree.tostring(boundary_node, pretty_print=True, encoding="unicode")
-
-    start = full.find(frag)
-    if start == -1:
-        raise RuntimeError("Slice not found")
-
-    start_line = full[:start].count("\n")
-    end_line = start_line + frag.count("\n")
-
-    return frag, (start_line, end_line)
+def extract_slice(source_map: SourceMap, boundary_node):
+    """
+    Original text of boundary_node and its SliceSpan, in O(slice).
+    boundary_node must come from the tree source_map was parsed from.
+    """
+    span = source_map.span(boundary_node)
+    return source_map.text[span.start:span.end], span